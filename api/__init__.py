@@ -1,8 +1,60 @@
 import os
 
-from .db import Database
+from .db import DEFAULT_PRAGMAS, Database
 from .factory import create_api
+from .metrics import Metrics, record
+from .querylog import QueryLog
+from .sharding import ShardedDatabase
+from .signing import TokenSigner
+
+# Connection settings.
+# `DATABASE_PRAGMAS` overrides the default performance profile using
+# comma-separated `name=value` pairs, e.g. `synchronous=full,mmap_size=0`.
+pragmas = dict(DEFAULT_PRAGMAS)
+for item in filter(None, os.environ.get("DATABASE_PRAGMAS", "").split(",")):
+    name, _, value = item.partition("=")
+    pragmas[name.strip()] = value.strip()
+
+# Signed tokens are issued if a secret is configured.
+secret = os.environ.get("TOKEN_SECRET")
+signer = TokenSigner(secret.encode()) if secret else None
+
+# Statements are timed if a slow query threshold (in milliseconds) is set.
+slow_query_ms = os.environ.get("DATABASE_SLOW_QUERY_MS")
+query_log = QueryLog(float(slow_query_ms) / 1000) if slow_query_ms else None
+
+# Options of the database (or of each shard).
+options = dict(
+    pool_size=int(os.environ.get("DATABASE_POOL_SIZE", 8)),
+    pragmas=pragmas,
+    tracks_format=os.environ.get("DATABASE_TRACKS_FORMAT", "json"),
+    compression_level=int(os.environ.get("DATABASE_COMPRESSION_LEVEL", 0)),
+    write_behind=float(os.environ.get("DATABASE_WRITE_BEHIND", 0)),
+    cache_size=int(os.environ.get("DATABASE_CACHE_SIZE", 32 * 2 ** 20)),
+    token_cache_ttl=float(os.environ.get("DATABASE_TOKEN_CACHE_TTL", 30)),
+    token_signer=signer,
+    revocation_refresh=float(os.environ.get("TOKEN_REVOCATION_REFRESH", 5)),
+    token_sweep_interval=float(os.environ.get("TOKEN_SWEEP_INTERVAL", 0)),
+    on_timing=record,
+    query_log=query_log,
+)
 
 # WSGI application.
-db = Database(os.environ.get("DATABASE", "polyphona.db"))
-app = create_api(db)
+# `DATABASE_SHARDS` splits the database into several files, by username,
+# using comma-separated paths (in a fixed order, see `api.sharding`).
+shards = [
+    path.strip()
+    for path in os.environ.get("DATABASE_SHARDS", "").split(",")
+    if path.strip()
+]
+if shards:
+    db = ShardedDatabase(shards, **options)
+else:
+    db = Database(os.environ.get("DATABASE", "polyphona.db"), **options)
+# The schema is not created on import, so that importing the package (e.g.
+# from tests or benchmarks) never creates a database file. It is created or
+# upgraded when gunicorn starts (see `gunicorn.conf.py`), or by running
+# `python -m api migrate`.
+# Metrics are shared by workers through `METRICS_DIR`, if set.
+metrics = Metrics(directory=os.environ.get("METRICS_DIR"))
+app = create_api(db, metrics=metrics)
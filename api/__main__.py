@@ -0,0 +1,125 @@
+"""Command line interface.
+
+Usage:
+
+    python -m api <command> [options]
+
+Commands operate on the database configured by the same environment
+variables as the server (see the README).
+"""
+
+import argparse
+from typing import List, Optional
+
+from . import db, options
+from .sharding import rebalance
+from .storage import FORMATS
+
+
+def migrate(args: argparse.Namespace):
+    db.generate_schema()
+    # With `gunicorn --preload`, workers must not inherit SQLite connections
+    # opened before fork().
+    db.close()
+    print("The database schema is up to date.")
+
+
+def repack(args: argparse.Namespace):
+    if args.format is not None:
+        db.tracks_format = args.format
+    if args.compression_level is not None:
+        db.compression_level = args.compression_level
+
+    count = db.repack_songs(batch_size=args.batch_size)
+    print(
+        f"Re-encoded {count} song(s) as {db.tracks_format!r} "
+        f"(compression level: {db.compression_level})."
+    )
+
+
+def sweep_tokens(args: argparse.Namespace):
+    count, elapsed = db.sweep_expired_tokens(
+        batch_size=args.batch_size, pause=args.pause
+    )
+    print(f"Deleted {count} expired token(s) in {elapsed:.2f}s.")
+
+
+def rebalance_shards(args: argparse.Namespace):
+    db.close()
+    counts = rebalance(args.old, args.new, **options)
+    print(
+        f"Moved {counts['users']} user(s) and {counts['songs']} song(s), "
+        f"renumbered {counts['renumbered']} song(s)."
+    )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m api")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser(
+        "migrate",
+        help=(
+            "Create missing tables and apply pending migrations. This is "
+            "done automatically when gunicorn starts."
+        ),
+    )
+    command.set_defaults(func=migrate)
+
+    command = commands.add_parser(
+        "repack",
+        help=(
+            "Re-encode (and compress) stored tracks using the configured "
+            "tracks format and compression level."
+        ),
+    )
+    command.add_argument("--batch-size", type=int, default=100)
+    command.add_argument(
+        "--format", choices=FORMATS, help="Override the tracks format."
+    )
+    command.add_argument(
+        "--compression-level",
+        type=int,
+        choices=range(10),
+        help="Override the compression level (0 disables compression).",
+    )
+    command.set_defaults(func=repack)
+
+    command = commands.add_parser(
+        "sweep-tokens",
+        help="Delete expired tokens (and revocations of expired tokens).",
+    )
+    command.add_argument("--batch-size", type=int, default=500)
+    command.add_argument(
+        "--pause",
+        type=float,
+        default=0,
+        help="Seconds to wait between batches.",
+    )
+    command.set_defaults(func=sweep_tokens)
+
+    command = commands.add_parser(
+        "rebalance",
+        help=(
+            "Move users and their songs and tokens to their shard after "
+            "changing the list of shards. Stop the server first."
+        ),
+    )
+    command.add_argument(
+        "--from",
+        dest="old",
+        nargs="+",
+        required=True,
+        help="Current shards, in order (or a single unsharded database).",
+    )
+    command.add_argument(
+        "--to", dest="new", nargs="+", required=True, help="New shards."
+    )
+    command.set_defaults(func=rebalance_shards)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+"""Performance benchmarks for the API server.
+
+Benchmarks are not part of the test suite. Run them as modules, e.g.:
+
+    python -m api.benchmarks.pool
+"""
@@ -0,0 +1,43 @@
+"""JSON codec benchmark.
+
+Compares the encoding and decoding time of each backend of ``api.codec``,
+for songs of increasing size.
+
+Usage:
+
+    python -m api.benchmarks.codec [--tracks N] [--repeat N]
+"""
+
+import argparse
+
+from .. import codec
+from .data import make_tracks
+from .storage import measure
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Backend in use: {codec.BACKEND}")
+    print(
+        f"{'notes':>8} {'backend':>10} {'bytes':>10} "
+        f"{'dumps (ms)':>12} {'loads (ms)':>12}"
+    )
+    for notes in (100, 1000, 10000):
+        song = {"name": "Song", "tracks": make_tracks(args.tracks, notes)}
+        for name, (dumps, loads) in sorted(codec.BACKENDS.items()):
+            data = dumps(song)
+            assert loads(data) == song
+            encode = measure(lambda: dumps(song), args.repeat)
+            decode = measure(lambda: loads(data), args.repeat)
+            print(
+                f"{args.tracks * notes:>8} {name:>10} {len(data):>10} "
+                f"{encode * 1000:>12.2f} {decode * 1000:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Synthetic data for benchmarks."""
+
+import random
+from typing import List
+
+NOTE_NAMES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+INSTRUMENTS = ("Cello", "Piano", "Drums", "Violin", "Bass")
+
+
+def make_tracks(tracks: int, notes: int, seed: int = 0) -> List[dict]:
+    """Generate tracks shaped like those sent by the desktop app.
+
+    Parameters
+    ----------
+    tracks : int
+        The number of tracks.
+    notes : int
+        The number of notes per track.
+    seed : int, optional
+        Seed of the random number generator. Defaults to ``0``.
+
+    Returns
+    -------
+    tracks : list of dict
+    """
+    rng = random.Random(seed)
+    result = []
+    for number in range(tracks):
+        instrument = INSTRUMENTS[number % len(INSTRUMENTS)]
+        track_notes = []
+        for index in range(notes):
+            midi = rng.randint(21, 108)
+            track_notes.append(
+                {
+                    "midi": midi,
+                    "time": index * 0.25,
+                    "note": f"{NOTE_NAMES[midi % 12]}{midi // 12 - 1}",
+                    "velocity": rng.randint(40, 127),
+                    "duration": rng.choice((0.25, 0.5, 1.0, 2.0)),
+                    "instrumentNumber": number % 128,
+                }
+            )
+        result.append(
+            {
+                "id": number + 1,
+                "name": instrument,
+                "isMuted": False,
+                "notes": track_notes,
+                "startTime": 0,
+                "duration": notes * 0.25,
+                "instrument": instrument,
+            }
+        )
+    return result
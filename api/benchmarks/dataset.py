@@ -0,0 +1,173 @@
+"""Synthetic dataset generator.
+
+Populates a database with users, each with a library of songs, using bulk
+inserts. User ``user{n}`` has the password ``user{n}``, which is what
+``api.benchmarks.load`` expects.
+
+To keep generation fast, songs share a limited number of distinct track
+sets (``--variants``), each encoded once.
+
+Usage:
+
+    python -m api.benchmarks.dataset DATABASE [--users N] [--songs N]
+        [--tracks N] [--notes N] [--variants N] [--seed N]
+"""
+
+import argparse
+import datetime
+import os
+import random
+import time
+
+from ..db import DEFAULT_PRAGMAS, Database, count_notes
+from ..storage import FORMATS
+from .data import make_tracks
+
+
+def populate(
+    db: Database,
+    users: int,
+    songs: int,
+    tracks: int,
+    notes: int,
+    variants: int = 8,
+    seed: int = 0,
+    batch_size: int = 100,
+) -> int:
+    """Add users and their songs to a database.
+
+    Parameters
+    ----------
+    db : Database
+    users : int
+        The number of users to create.
+    songs : int
+        The average number of songs per user. Each user gets between
+        half and one and a half times this number.
+    tracks : int
+        The number of tracks per song.
+    notes : int
+        The number of notes per track.
+    variants : int, optional
+        The number of distinct track sets. Defaults to ``8``.
+    seed : int, optional
+        Seed of the random number generator. Defaults to ``0``.
+    batch_size : int, optional
+        The number of users inserted per transaction. Defaults to ``100``.
+
+    Returns
+    -------
+    count : int
+        The number of songs created.
+    """
+    rng = random.Random(seed)
+    encoded = []
+    for variant in range(variants):
+        variant_tracks = make_tracks(tracks, notes, seed=seed + variant)
+        encoded.append(
+            (db._encode_tracks(variant_tracks), *count_notes(variant_tracks))
+        )
+
+    with db:
+        first_user, = db.cursor.execute(
+            "SELECT COUNT(*) FROM users"
+        ).fetchone()
+        last_id, = db.cursor.execute(
+            "SELECT COALESCE(MAX(SongID), 0) FROM songs"
+        ).fetchone()
+
+    count = 0
+    now = datetime.datetime.now()
+    for start in range(first_user, first_user + users, batch_size):
+        stop = min(start + batch_size, first_user + users)
+        user_rows, song_rows, link_rows = [], [], []
+        for number in range(start, stop):
+            username = f"user{number}"
+            user_rows.append((username, "User", str(number), username))
+            for index in range(rng.randint(songs // 2, songs * 3 // 2)):
+                last_id += 1
+                age = datetime.timedelta(minutes=rng.randint(0, 100000))
+                created = now - age
+                song_rows.append(
+                    (
+                        last_id,
+                        f"Song {index}",
+                        created,
+                        created,
+                        *rng.choice(encoded),
+                    )
+                )
+                link_rows.append((last_id, username))
+
+        with db.transaction():
+            db.cursor.executemany(
+                """
+                INSERT INTO users (UserName, FirstName, LastName, Password)
+                VALUES (?,?,?,?)
+                """,
+                user_rows,
+            )
+            db.cursor.executemany(
+                """
+                INSERT INTO songs (
+                    SongID, SongName, Created, Updated, TracksJson,
+                    TrackCount, NoteCount
+                )
+                VALUES (?,?,?,?,?,?,?)
+                """,
+                song_rows,
+            )
+            db.cursor.executemany(
+                "INSERT INTO song_user_links (SongID, UserName) VALUES (?,?)",
+                link_rows,
+            )
+        count += len(song_rows)
+
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("database", help="Path to the database file.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--songs", type=int, default=100, help="Per user.")
+    parser.add_argument("--tracks", type=int, default=4)
+    parser.add_argument("--notes", type=int, default=1000, help="Per track.")
+    parser.add_argument("--variants", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tracks-format", choices=FORMATS, default="json")
+    parser.add_argument("--compression-level", type=int, default=0)
+    args = parser.parse_args()
+
+    # The dataset can be generated again if anything goes wrong, so
+    # durability is traded for speed.
+    db = Database(
+        args.database,
+        pragmas={**DEFAULT_PRAGMAS, "synchronous": "off"},
+        tracks_format=args.tracks_format,
+        compression_level=args.compression_level,
+    )
+    db.generate_schema()
+
+    start = time.perf_counter()
+    count = populate(
+        db,
+        users=args.users,
+        songs=args.songs,
+        tracks=args.tracks,
+        notes=args.notes,
+        variants=args.variants,
+        seed=args.seed,
+    )
+    elapsed = time.perf_counter() - start
+    db.close()
+
+    size = os.path.getsize(args.database) / 2 ** 20
+    print(
+        f"Created {args.users} user(s) and {count} song(s) "
+        f"in {elapsed:.1f}s ({size:.1f} MiB)."
+    )
+
+
+if __name__ == "__main__":
+    main()
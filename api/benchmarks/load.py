@@ -0,0 +1,228 @@
+"""End-to-end load test.
+
+Replays a mix of requests against a running server, from several
+concurrent clients, and reports the throughput and latency of each route.
+
+The database must have been populated with ``api.benchmarks.dataset``,
+e.g.:
+
+    python -m api.benchmarks.dataset load.db --users 1000
+    DATABASE=load.db gunicorn --workers 4 api:app
+
+Each client logs in as a random user, then sends requests picked at random
+according to ``--mix``, a comma-separated list of ``operation=weight``:
+
+- ``login``: ``POST /tokens/``.
+- ``list``: ``GET /users/{username}/songs`` (summaries).
+- ``get``: ``GET /songs/{pk}``.
+- ``put``: ``PUT /songs/{pk}``.
+- ``delete``: ``POST /songs/`` then ``DELETE /songs/{pk}``, so that
+  libraries keep their size.
+
+Usage:
+
+    python -m api.benchmarks.load [--url URL] [--users N] [--clients N]
+        [--duration SECONDS] [--mix MIX] [--output FILE]
+"""
+
+import argparse
+import collections
+import http.client
+import json
+import random
+import threading
+import time
+import urllib.parse
+from typing import Dict, List, Optional
+
+from .. import codec
+from .data import make_tracks
+
+DEFAULT_MIX = "login=1,list=2,get=10,put=5,delete=1"
+
+
+def percentile(timings: List[float], rank: float) -> float:
+    """Return the ``rank`` percentile of sorted ``timings``."""
+    if not timings:
+        return 0.0
+    return timings[min(len(timings) - 1, int(len(timings) * rank / 100))]
+
+
+class Client(threading.Thread):
+    """A client sending requests until ``deadline``.
+
+    Latencies (in seconds) are recorded in ``timings`` by route, and
+    responses with an error status (or no response) in ``errors``.
+    """
+
+    def __init__(
+        self, url: str, users: int, mix: Dict[str, int], body: bytes, seed: int
+    ):
+        super().__init__(daemon=True)
+        parsed = urllib.parse.urlsplit(url)
+        self.conn = http.client.HTTPConnection(parsed.hostname, parsed.port)
+        self.rng = random.Random(seed)
+        self.username = f"user{self.rng.randrange(users)}"
+        self.operations = list(mix)
+        self.weights = list(mix.values())
+        self.body = body
+        self.token = ""
+        self.song_ids: List[int] = []
+        self.deadline = 0.0
+        self.timings: Dict[str, List[float]] = collections.defaultdict(list)
+        self.errors: Dict[str, int] = collections.Counter()
+
+    def request(
+        self, route: str, method: str, path: str, body: Optional[bytes] = None
+    ) -> Optional[bytes]:
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Token {self.token}"
+        start = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.errors[route] += 1
+            return None
+        self.timings[route].append(time.perf_counter() - start)
+        if response.status >= 400:
+            self.errors[route] += 1
+            return None
+        return data
+
+    def login(self):
+        credentials = {"username": self.username, "password": self.username}
+        data = self.request(
+            "POST /tokens/", "POST", "/tokens", codec.dumps(credentials)
+        )
+        if data is not None:
+            self.token = codec.loads(data)["token"]
+
+    def list(self):
+        data = self.request(
+            "GET /users/{username}/songs",
+            "GET",
+            f"/users/{self.username}/songs"
+            "?fields=id,name,updated,track_count,note_count",
+        )
+        if data is not None:
+            self.song_ids = [song["id"] for song in codec.loads(data)]
+
+    def get(self):
+        if self.song_ids:
+            pk = self.rng.choice(self.song_ids)
+            self.request("GET /songs/{pk}", "GET", f"/songs/{pk}")
+
+    def put(self):
+        if self.song_ids:
+            pk = self.rng.choice(self.song_ids)
+            self.request("PUT /songs/{pk}", "PUT", f"/songs/{pk}", self.body)
+
+    def delete(self):
+        data = self.request("POST /songs/", "POST", "/songs", self.body)
+        if data is not None:
+            pk = codec.loads(data)["id"]
+            self.request("DELETE /songs/{pk}", "DELETE", f"/songs/{pk}")
+
+    def run(self):
+        self.login()
+        self.list()
+        while time.perf_counter() < self.deadline:
+            operation = self.rng.choices(self.operations, self.weights)[0]
+            getattr(self, operation)()
+        self.conn.close()
+
+
+def run(args: argparse.Namespace) -> dict:
+    """Run the load test.
+
+    Returns
+    -------
+    report : dict
+        Statistics by route: number of requests and errors, requests per
+        second, and latency percentiles in milliseconds.
+    """
+    mix = {}
+    for item in args.mix.split(","):
+        operation, _, weight = item.partition("=")
+        if operation not in ("login", "list", "get", "put", "delete"):
+            raise SystemExit(f"Unknown operation: {operation!r}")
+        mix[operation] = int(weight or 1)
+
+    song = {
+        "name": "Load test",
+        "tracks": make_tracks(tracks=args.tracks, notes=args.notes),
+    }
+    body = codec.dumps(song)
+    clients = [
+        Client(args.url, args.users, mix, body, seed=args.seed + index)
+        for index in range(args.clients)
+    ]
+
+    start = time.perf_counter()
+    for client in clients:
+        client.deadline = start + args.duration
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - start
+
+    timings: Dict[str, List[float]] = collections.defaultdict(list)
+    errors: Dict[str, int] = collections.Counter()
+    for client in clients:
+        for route, values in client.timings.items():
+            timings[route].extend(values)
+        errors.update(client.errors)
+
+    report = {}
+    for route in sorted(set(timings) | set(errors)):
+        values = sorted(timings[route])
+        report[route] = {
+            "requests": len(values),
+            "errors": errors[route],
+            "requests_per_s": len(values) / elapsed,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument(
+        "--users", type=int, default=1000, help="Users in the dataset."
+    )
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--tracks", type=int, default=4, help="For put.")
+    parser.add_argument("--notes", type=int, default=1000, help="For put.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Save the report to this JSON file.")
+    args = parser.parse_args()
+
+    report = run(args)
+
+    print(
+        f"{'route':<30} {'requests':>9} {'errors':>7} {'req/s':>8} "
+        f"{'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9}"
+    )
+    for route, stats in report.items():
+        print(
+            f"{route:<30} {stats['requests']:>9} {stats['errors']:>7} "
+            f"{stats['requests_per_s']:>8.1f} {stats['p50_ms']:>9.1f} "
+            f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Connection pool benchmark.
+
+Measures the requests/sec of typical API calls with connection pooling
+disabled (a new SQLite connection per database call) and enabled.
+
+Usage:
+
+    python -m api.benchmarks.pool [--requests N] [--pool-size N]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from falcon.testing import TestClient
+
+from ..db import Database
+from ..factory import create_api
+from .data import make_tracks
+
+SONG = {"name": "Benchmark", "tracks": make_tracks(tracks=1, notes=50)}
+
+
+def run(pool_size: int, requests: int) -> float:
+    """Run the benchmark against a fresh database.
+
+    Parameters
+    ----------
+    pool_size : int
+        Passed to ``Database``.
+    requests : int
+        The number of requests to send for each kind of request.
+
+    Returns
+    -------
+    rps : float
+        The number of requests processed per second.
+    """
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    db = Database(path, pool_size=pool_size)
+    db.generate_schema()
+
+    try:
+        db.create_user(
+            username="bench",
+            first_name="bench",
+            last_name="bench",
+            password="bench",
+        )
+        db.save_token(username="bench", token="bench")
+        headers = {"Authorization": "Token bench"}
+        client = TestClient(create_api(db))
+
+        start = time.perf_counter()
+        for _ in range(requests):
+            pk = client.simulate_post(
+                "/songs", headers=headers, json=SONG
+            ).json["id"]
+            client.simulate_get(f"/songs/{pk}", headers=headers)
+            client.simulate_put(f"/songs/{pk}", headers=headers, json=SONG)
+        elapsed = time.perf_counter() - start
+    finally:
+        db.remove()
+
+    return 3 * requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--pool-size", type=int, default=8)
+    args = parser.parse_args()
+
+    before = run(pool_size=0, requests=args.requests)
+    after = run(pool_size=args.pool_size, requests=args.requests)
+
+    print(f"connect-per-call: {before:8.1f} req/s")
+    print(f"pooled ({args.pool_size:>2}):      {after:8.1f} req/s")
+    print(f"speedup:          {after / before:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
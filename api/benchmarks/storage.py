@@ -0,0 +1,57 @@
+"""Tracks storage format benchmark.
+
+Compares the size and the encoding/decoding time of tracks stored in each
+format of ``api.storage``, with and without compression, for songs of
+increasing size.
+
+Usage:
+
+    python -m api.benchmarks.storage [--tracks N] [--repeat N]
+"""
+
+import argparse
+import time
+
+from ..storage import FORMATS, decode_tracks, encode_tracks
+from .data import make_tracks
+
+
+def measure(func, repeat: int) -> float:
+    """Return the best execution time of ``func()`` over ``repeat`` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f"{'notes':>8} {'format':>10} {'zlib':>5} {'bytes':>10} "
+        f"{'encode (ms)':>12} {'decode (ms)':>12}"
+    )
+    for notes in (100, 1000, 10000):
+        tracks = make_tracks(tracks=args.tracks, notes=notes)
+        for format in FORMATS:
+            for level in (0, 1, 6):
+                value = encode_tracks(tracks, format, level)
+                assert decode_tracks(value) == tracks
+                encode = measure(
+                    lambda: encode_tracks(tracks, format, level), args.repeat
+                )
+                decode = measure(lambda: decode_tracks(value), args.repeat)
+                size = len(value.encode() if isinstance(value, str) else value)
+                print(
+                    f"{args.tracks * notes:>8} {format:>10} {level:>5} "
+                    f"{size:>10} {encode * 1000:>12.2f} {decode * 1000:>12.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
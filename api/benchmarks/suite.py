@@ -0,0 +1,360 @@
+"""Microbenchmark suite.
+
+Times every ``Database`` method and every route (through Falcon's
+``TestClient``) against a fresh database holding a library of synthetic
+songs. Results can be saved as JSON and compared with a previous run.
+
+Benchmarks that add songs to the library run last, so that the others
+run against a library of exactly ``--songs`` songs.
+
+Usage:
+
+    python -m api.benchmarks.suite [--songs N] [--tracks N] [--notes N]
+        [--iterations N] [--filter TEXT] [--output FILE] [--compare FILE]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from falcon.testing import TestClient
+
+from .. import codec
+from ..db import Database
+from ..factory import create_api
+from .data import make_tracks
+
+# A benchmark's name and function.
+Case = Tuple[str, Callable[[], object]]
+
+USERNAME = "bench"
+HEADERS = {"Authorization": "Token bench"}
+
+
+def _database_cases(
+    db: Database, song_ids: List[int], tracks: list
+) -> Tuple[List[Case], List[Case]]:
+    # Return benchmarks that do not add songs, and those that do.
+    song = {"name": "Benchmark", "tracks": tracks}
+    song_id = song_ids[len(song_ids) // 2]
+    ids = song_ids[:10]
+    counter = itertools.count()
+
+    def create_song():
+        pk = db.create_song(**song)
+        db.create_song_user_link(pk, USERNAME)
+
+    def delete_song():
+        pk = db.create_song(**song)
+        db.create_song_user_link(pk, USERNAME)
+        db.delete_song(pk, USERNAME)
+
+    def create_user():
+        username = f"user{next(counter)}"
+        db.create_user(username, username, username, username)
+
+    def save_token():
+        db.save_token(USERNAME, f"token{next(counter)}")
+
+    def delete_token():
+        token = f"deleted{next(counter)}"
+        db.save_token(USERNAME, token)
+        db.delete_token(token)
+
+    patch = [{"op": "replace", "path": "/tracks/0/notes/0/time", "value": 1}]
+    cases = [
+        ("db.get_song_by_id", lambda: db.get_song_by_id(song_id)),
+        ("db.get_song_json", lambda: db.get_song_json(song_id)),
+        ("db.get_song_updated", lambda: db.get_song_updated(song_id)),
+        ("db.get_songs_by_ids", lambda: db.get_songs_by_ids(ids)),
+        ("db.get_songs_by_user", lambda: db.get_songs_by_user(USERNAME)),
+        (
+            "db.get_song_summaries_by_user",
+            lambda: db.get_song_summaries_by_user(USERNAME),
+        ),
+        (
+            "db.get_songs_version_by_user",
+            lambda: db.get_songs_version_by_user(USERNAME),
+        ),
+        (
+            "db.update_song",
+            lambda: db.update_song(song_id, username=USERNAME, **song),
+        ),
+        ("db.patch_song", lambda: db.patch_song(song_id, patch, USERNAME)),
+        ("db.delete_song (with create)", delete_song),
+        ("db.create_user", create_user),
+        ("db.create_token", lambda: db.create_token(USERNAME)),
+        ("db.user_exists", lambda: db.user_exists(USERNAME)),
+        ("db.get_user", lambda: db.get_user(USERNAME)),
+        ("db.check_user", lambda: db.check_user(USERNAME, USERNAME)),
+        ("db.save_token", save_token),
+        ("db.reverse_token", lambda: db.reverse_token("bench")),
+        ("db.delete_token (with save)", delete_token),
+        ("db.sweep_expired_tokens", db.sweep_expired_tokens),
+    ]
+    adding = [
+        ("db.create_song", create_song),
+        ("db.create_songs", lambda: db.create_songs([song] * 10, USERNAME)),
+    ]
+    return cases, adding
+
+
+def _route_cases(
+    client: TestClient, song_ids: List[int], tracks: list
+) -> Tuple[List[Case], List[Case]]:
+    song = {"name": "Benchmark", "tracks": tracks}
+    song_id = song_ids[len(song_ids) // 2]
+    counter = itertools.count()
+    credentials = {"username": USERNAME, "password": USERNAME}
+    patch = [{"op": "replace", "path": "/tracks/0/notes/0/time", "value": 1}]
+
+    def create_user():
+        username = f"user{next(counter)}"
+        client.simulate_post(
+            "/users",
+            json={
+                "username": username,
+                "first_name": username,
+                "last_name": username,
+                "password": username,
+            },
+        )
+
+    def delete_token():
+        token = client.simulate_post("/tokens", json=credentials).json
+        client.simulate_delete(f"/tokens/{token['token']}")
+
+    def delete_song():
+        pk = client.simulate_post("/songs", headers=HEADERS, json=song).json
+        client.simulate_delete(f"/songs/{pk['id']}", headers=HEADERS)
+
+    cases = [
+        ("POST /users/", create_user),
+        (
+            "POST /tokens/",
+            lambda: client.simulate_post("/tokens", json=credentials),
+        ),
+        ("DELETE /tokens/{token} (with POST)", delete_token),
+        (
+            "GET /users/{username}/songs",
+            lambda: client.simulate_get(
+                f"/users/{USERNAME}/songs", headers=HEADERS
+            ),
+        ),
+        (
+            "GET /users/{username}/songs?fields=id,name",
+            lambda: client.simulate_get(
+                f"/users/{USERNAME}/songs",
+                headers=HEADERS,
+                params={"fields": "id,name"},
+            ),
+        ),
+        (
+            "GET /users/{username}/songs?limit=10",
+            lambda: client.simulate_get(
+                f"/users/{USERNAME}/songs",
+                headers=HEADERS,
+                params={"limit": 10},
+            ),
+        ),
+        (
+            "GET /songs/{pk}",
+            lambda: client.simulate_get(f"/songs/{song_id}", headers=HEADERS),
+        ),
+        (
+            "GET /songs/?ids=",
+            lambda: client.simulate_get(
+                "/songs/",
+                headers=HEADERS,
+                params={"ids": ",".join(map(str, song_ids[:10]))},
+            ),
+        ),
+        (
+            "PUT /songs/{pk}",
+            lambda: client.simulate_put(
+                f"/songs/{song_id}", headers=HEADERS, json=song
+            ),
+        ),
+        (
+            "PATCH /songs/{pk}",
+            lambda: client.simulate_patch(
+                f"/songs/{song_id}",
+                headers={
+                    **HEADERS,
+                    "Content-Type": "application/json-patch+json",
+                },
+                json=patch,
+            ),
+        ),
+        ("DELETE /songs/{pk} (with POST)", delete_song),
+    ]
+    adding = [
+        (
+            "POST /songs/",
+            lambda: client.simulate_post("/songs", headers=HEADERS, json=song),
+        ),
+        (
+            "POST /songs/batch",
+            lambda: client.simulate_post(
+                "/songs/batch", headers=HEADERS, json={"songs": [song] * 10}
+            ),
+        ),
+    ]
+    return cases, adding
+
+
+def measure(func: Callable[[], object], iterations: int) -> Dict[str, float]:
+    """Time ``iterations`` calls of ``func()``.
+
+    Returns
+    -------
+    stats : dict
+        Mean, median, minimum and 95th percentile, in microseconds,
+        and the number of calls per second.
+    """
+    func()  # Warm up.
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    mean = statistics.mean(timings)
+    return {
+        "mean_us": mean,
+        "median_us": statistics.median(timings),
+        "min_us": timings[0],
+        "p95_us": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "ops_per_s": 1e6 / mean,
+    }
+
+
+@contextmanager
+def _make_database(args: argparse.Namespace) -> Iterator[Database]:
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    db = Database(
+        path,
+        tracks_format=args.tracks_format,
+        cache_size=args.cache_size,
+        token_cache_ttl=args.token_cache_ttl,
+    )
+    db.generate_schema()
+    try:
+        yield db
+    finally:
+        db.remove()
+
+
+def run(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    """Run the benchmarks selected by ``args.filter``.
+
+    Returns
+    -------
+    results : dict
+        Statistics of each benchmark (see ``measure()``), by name.
+    """
+    tracks = make_tracks(tracks=args.tracks, notes=args.notes)
+    results = {}
+    with _make_database(args) as db:
+        db.create_user(
+            username=USERNAME,
+            first_name=USERNAME,
+            last_name=USERNAME,
+            password=USERNAME,
+        )
+        db.save_token(username=USERNAME, token="bench")
+        song_ids = db.create_songs(
+            [
+                {"name": f"Song {i}", "tracks": tracks}
+                for i in range(args.songs)
+            ],
+            USERNAME,
+        )
+        client = TestClient(create_api(db))
+
+        db_cases, db_adding = _database_cases(db, song_ids, tracks)
+        route_cases, route_adding = _route_cases(client, song_ids, tracks)
+        cases = db_cases + route_cases + db_adding + route_adding
+        for name, func in cases:
+            if args.filter and args.filter not in name:
+                continue
+            results[name] = measure(func, args.iterations)
+            print(
+                f"{name:<48} {results[name]['median_us']:>12.1f} "
+                f"{results[name]['p95_us']:>12.1f} "
+                f"{results[name]['ops_per_s']:>10.1f}"
+            )
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], path: str):
+    """Print the speedup of each benchmark relative to a previous run."""
+    with open(path) as file:
+        baseline = json.load(file)["results"]
+    print(
+        f"\n{'benchmark':<48} {'before (us)':>12} {'after (us)':>12} "
+        f"{'speedup':>10}"
+    )
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["median_us"]
+        after = stats["median_us"]
+        print(
+            f"{name:<48} {before:>12.1f} {after:>12.1f} "
+            f"{before / after:>9.2f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--songs", type=int, default=100, help="Library size.")
+    parser.add_argument("--tracks", type=int, default=4)
+    parser.add_argument("--notes", type=int, default=200, help="Per track.")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--tracks-format", default="json")
+    parser.add_argument("--cache-size", type=int, default=0)
+    parser.add_argument("--token-cache-ttl", type=float, default=0)
+    parser.add_argument("--filter", help="Only run benchmarks matching this.")
+    parser.add_argument("--output", help="Save results to this JSON file.")
+    parser.add_argument("--compare", help="Compare with this JSON file.")
+    args = parser.parse_args()
+
+    print(
+        f"{'benchmark':<48} {'median (us)':>12} {'p95 (us)':>12} {'ops/s':>10}"
+    )
+    results = run(args)
+
+    if args.output:
+        report = {
+            "parameters": {
+                key: value
+                for key, value in vars(args).items()
+                if key not in ("output", "compare")
+            },
+            "environment": {
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "codec": codec.BACKEND,
+                "platform": platform.platform(),
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
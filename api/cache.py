@@ -0,0 +1,172 @@
+"""In-process caches."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """A thread-safe least-recently-used cache, bounded in bytes.
+
+    Each value is stored along with a version (e.g. a modification date):
+    a lookup only hits if the cached version is the expected one, so that
+    callers can cheaply detect values that were changed elsewhere.
+
+    Parameters
+    ----------
+    max_size : int
+        The maximum total size of cached values, in bytes. Least recently
+        used values are evicted to stay within this size.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.__entries: "OrderedDict[Hashable, Tuple[Any, Any, int]]" = (
+            OrderedDict()
+        )
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, key: Hashable, version: Any) -> Optional[Any]:
+        """Return the value cached for ``key`` if it has version ``version``.
+
+        Parameters
+        ----------
+        key : hashable
+        version : any
+
+        Returns
+        -------
+        value : any or None
+            ``None`` if no value is cached for ``key`` or if the cached
+            value is outdated.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, version: Any, value: Any, size: int):
+        """Cache a value.
+
+        Values larger than the whole cache are not cached.
+
+        Parameters
+        ----------
+        key : hashable
+        version : any
+        value : any
+        size : int
+            The size of ``value``, in bytes.
+        """
+        with self.__lock:
+            self.__discard(key)
+            if size > self.max_size:
+                return
+            self.__entries[key] = (version, value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, _, evicted) = self.__entries.popitem(last=False)
+                self.size -= evicted
+
+    def pop(self, key: Hashable):
+        """Remove the value cached for ``key``, if any."""
+        with self.__lock:
+            self.__discard(key)
+
+    def clear(self):
+        """Remove all cached values."""
+        with self.__lock:
+            self.__entries.clear()
+            self.size = 0
+
+    def __discard(self, key: Hashable):
+        entry = self.__entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+
+class TTLCache:
+    """A thread-safe cache of values that expire after some time.
+
+    Parameters
+    ----------
+    ttl : float
+        The time values are cached for, in seconds.
+    max_entries : int, optional
+        The maximum number of cached values. The oldest values are evicted
+        to stay within this number. Defaults to ``10000``.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.__entries: "OrderedDict[Hashable, Tuple[Any, float]]" = (
+            OrderedDict()
+        )
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the value cached for ``key``, unless it has expired.
+
+        Parameters
+        ----------
+        key : hashable
+
+        Returns
+        -------
+        value : any or None
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self.__entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Cache a value.
+
+        Parameters
+        ----------
+        key : hashable
+        value : any
+        ttl : float, optional
+            The time this value is cached for, in seconds, if shorter than
+            the cache's ``ttl``.
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self.__lock:
+            self.__entries.pop(key, None)
+            self.__entries[key] = (value, time.monotonic() + ttl)
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        """Remove the value cached for ``key``, if any."""
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def clear(self):
+        """Remove all cached values."""
+        with self.__lock:
+            self.__entries.clear()
@@ -0,0 +1,63 @@
+"""JSON encoding and decoding.
+
+All JSON work goes through this module: request and response bodies (see
+``create_api()``) as well as stored tracks (see ``api.storage``).
+
+The fastest available backend is used: orjson if it is installed, and the
+standard library's ``json`` module otherwise. Both backends produce compact
+UTF-8 JSON (without whitespace), so responses look the same whichever
+backend is used. Only the formatting of some floats may differ
+(e.g. ``1e16`` instead of ``1e+16``), and orjson decodes integers that
+don't fit in 64 bits as floats.
+"""
+
+import json
+from typing import Any, Callable, Dict, Tuple, Union
+
+Dumps = Callable[[Any], bytes]
+Loads = Callable[[Union[str, bytes]], Any]
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode(
+        "utf-8"
+    )
+
+
+def _json_loads(data: Union[str, bytes]) -> Any:
+    return json.loads(data)
+
+
+BACKENDS: Dict[str, Tuple[Dumps, Loads]] = {"json": (_json_dumps, _json_loads)}
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    pass
+else:
+
+    def _orjson_dumps(obj: Any) -> bytes:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # orjson does not support e.g. integers over 64 bits.
+            return _json_dumps(obj)
+
+    def _orjson_loads(data: Union[str, bytes]) -> Any:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson does not support e.g. `NaN`.
+            return _json_loads(data)
+
+    BACKENDS["orjson"] = (_orjson_dumps, _orjson_loads)
+
+# Name of the backend in use.
+BACKEND = "orjson" if "orjson" in BACKENDS else "json"
+
+# Functions of the backend in use.
+# `dumps(obj)` returns UTF-8 encoded bytes.
+# `loads(data)` accepts either `str` or UTF-8 encoded `bytes`.
+dumps: Dumps
+loads: Loads
+dumps, loads = BACKENDS[BACKEND]
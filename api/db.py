@@ -1,9 +1,221 @@
+import atexit
 import datetime
-import json
+import logging
 import os
+import queue
 import sqlite3
-from contextlib import suppress
-from typing import Any, List, Optional
+import threading
+import time
+import uuid
+from contextlib import contextmanager, suppress
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from .jsonpatch import PatchError, apply_patch
+from . import codec
+from .cache import LRUCache, TTLCache
+from .querylog import QueryLog, TimedConnection
+from .signing import TokenSigner, is_signed
+from .storage import FORMAT_JSON, decode_tracks, encode_tracks, tracks_json
+
+logger = logging.getLogger(__name__)
+
+# Tokens expire when they have not been used for this long.
+TOKEN_LIFETIME = datetime.timedelta(minutes=15)
+
+# Performance profile applied to every new connection with ``PRAGMA``
+# statements. It is suited to several (possibly threaded) gunicorn workers
+# sharing one database file:
+#
+# - ``journal_mode=wal``: readers no longer block on writers (and vice versa),
+#   so autosaves do not stall concurrent ``GET`` requests. The journal mode is
+#   persistent and stored in the database file.
+# - ``synchronous=normal``: with WAL, commits no longer wait for an fsync;
+#   the database stays consistent but the last commits may be rolled back
+#   after a power loss (not after an application crash).
+# - ``busy_timeout``: wait up to 5 seconds for the write lock held by another
+#   worker instead of failing with "database is locked".
+# - ``cache_size``: 16 MiB page cache per connection (negative values are
+#   expressed in KiB).
+# - ``mmap_size``: read the first 256 MiB of the file through memory mapping,
+#   which avoids copying pages from the OS cache.
+# - ``temp_store=memory``: keep temporary tables and indices in memory.
+DEFAULT_PRAGMAS: Dict[str, Union[str, int]] = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "busy_timeout": 5000,
+    "cache_size": -16000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "memory",
+}
+
+
+# Schema migrations.
+# Each migration receives a cursor and upgrades the schema by one version.
+# The schema version is stored in ``PRAGMA user_version``, so a database
+# at version ``n`` has had the first ``n`` migrations applied.
+# Migrations must only ever be appended to this list.
+
+
+def _index_song_user_links(cursor: sqlite3.Cursor):
+    # Listing a user's songs and checking song ownership.
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS song_user_links_user
+        ON song_user_links (UserName, SongID)
+        """
+    )
+    # Deleting the links of a song.
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS song_user_links_song
+        ON song_user_links (SongID)
+        """
+    )
+
+
+def _index_tokens(cursor: sqlite3.Cursor):
+    # Finding expired tokens.
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS tokens_refresh_date
+        ON tokens (RefreshDate)
+        """
+    )
+
+
+def _add_song_counts(cursor: sqlite3.Cursor):
+    # Derived counts, used to list songs without decoding tracks.
+    cursor.execute("ALTER TABLE songs ADD COLUMN TrackCount integer")
+    cursor.execute("ALTER TABLE songs ADD COLUMN NoteCount integer")
+    rows = cursor.execute("SELECT SongID, TracksJson FROM songs").fetchall()
+    for id, tracks in rows:
+        cursor.execute(
+            "UPDATE songs SET TrackCount = ?, NoteCount = ? WHERE SongID = ?",
+            (*count_notes(decode_tracks(tracks)), id),
+        )
+
+
+def _add_revoked_tokens(cursor: sqlite3.Cursor):
+    # Signed tokens that were deleted before they expired.
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            TokenID text primary key not null,
+            Expires datetime
+        )
+        """
+    )
+
+
+def _add_user_versions(cursor: sqlite3.Cursor):
+    # A version of each user's list of songs, bumped by triggers whenever
+    # it changes, so that listings get their ETag from a single row rather
+    # than by aggregating the user's songs. `Updated` is the latest update
+    # date of the user's songs (it is kept when songs are deleted).
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_versions (
+            UserName text primary key not null,
+            Version integer not null,
+            Updated datetime
+        )
+        """
+    )
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO user_versions (UserName, Version, Updated)
+        SELECT UserName, 1, MAX(Updated)
+        FROM song_user_links, songs
+        ON songs.SongID = song_user_links.SongID
+        GROUP BY UserName
+        """
+    )
+    # Songs are added, removed or renumbered through their links.
+    events = (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD"))
+    for event, row in events:
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS song_user_links_{event.lower()}
+            AFTER {event} ON song_user_links
+            BEGIN
+                INSERT INTO user_versions (UserName, Version, Updated)
+                VALUES (
+                    {row}.UserName,
+                    1,
+                    (SELECT Updated FROM songs WHERE SongID = {row}.SongID)
+                )
+                ON CONFLICT (UserName) DO UPDATE SET
+                    Version = Version + 1,
+                    Updated = COALESCE(
+                        MAX(Updated, excluded.Updated),
+                        Updated,
+                        excluded.Updated
+                    );
+            END
+            """
+        )
+    # Re-encoding tracks (see `Database.repack_songs()`) leaves songs'
+    # contents and update dates untouched, so it does not bump versions.
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS songs_update
+        AFTER UPDATE OF SongName, Updated ON songs
+        BEGIN
+            UPDATE user_versions SET
+                Version = Version + 1,
+                Updated = COALESCE(MAX(Updated, NEW.Updated), NEW.Updated)
+            WHERE UserName IN (
+                SELECT UserName FROM song_user_links
+                WHERE SongID = NEW.SongID
+            );
+        END
+        """
+    )
+
+
+MIGRATIONS: List[Callable[[sqlite3.Cursor], None]] = [
+    _index_song_user_links,
+    _index_tokens,
+    _add_song_counts,
+    _add_revoked_tokens,
+    _add_user_versions,
+]
+
+
+def count_notes(tracks: List[dict]) -> Tuple[int, int]:
+    """Count the tracks and notes of a song.
+
+    Tracks are not validated, so that songs saved with any JSON value as
+    tracks can still be counted: values other than a list count as no
+    tracks, and tracks other than dicts (or without a list of notes) as
+    tracks without notes.
+
+    Parameters
+    ----------
+    tracks : list of dict
+
+    Returns
+    -------
+    counts : tuple of (int, int)
+        The number of tracks and the total number of notes.
+    """
+    if not isinstance(tracks, list):
+        return 0, 0
+    notes = sum(
+        len(track["notes"])
+        for track in tracks
+        if isinstance(track, dict) and isinstance(track.get("notes"), list)
+    )
+    return len(tracks), notes
 
 
 class DoesNotExist(Exception):
@@ -34,25 +246,226 @@ class Database:
     This class exposes methods to interact with the database and manages
     connections and cursors itself.
 
+    Connections are kept in a pool and reused across calls, so that SQLite
+    does not have to re-open the database file and re-prepare statements
+    every time the database context is entered.
+
+    The stack of connections and cursors is kept per thread (or per
+    greenlet when gevent has patched the ``threading`` module), so a single
+    instance can be shared by concurrent request handlers.
+
     Parameters
     ----------
     path : str
         The path to the SQLite database file (that exists or should be created).
+    pool_size : int, optional
+        The maximum number of idle connections kept open for reuse.
+        Connections beyond this number are closed when released.
+        Use ``0`` to disable pooling and open a new connection every time.
+        Defaults to ``8``.
+    pragmas : dict, optional
+        ``PRAGMA`` settings applied to each new connection.
+        Defaults to ``DEFAULT_PRAGMAS``. Use an empty dict to keep
+        SQLite defaults.
+    tracks_format : str, optional
+        The format tracks are stored in, one of ``api.storage.FORMATS``.
+        Tracks are always readable whatever format they were stored in,
+        see ``.repack_songs()``. Defaults to ``"json"``.
+    compression_level : int, optional
+        The zlib compression level of stored tracks, from ``1`` (fastest)
+        to ``9`` (smallest). Defaults to ``0``, i.e. no compression.
+    write_behind : float, optional
+        If positive, enables write-behind mode: song updates are kept in
+        memory and written by a background thread every ``write_behind``
+        seconds, see ``.update_song()``. This is also the durability bound:
+        if the process crashes, at most this many seconds of updates are
+        lost. Defaults to ``0``, i.e. updates are written immediately.
+    cache_size : int, optional
+        If positive, songs read by ``.get_song_json()`` and
+        ``.get_song_by_id()`` are kept in an in-process LRU cache of at most
+        this many bytes (of JSON). Defaults to ``0``, i.e. no cache.
+    token_cache_ttl : float, optional
+        If positive, ``.reverse_token()`` results are cached in-process for
+        this many seconds (or until the token expires, if sooner).
+        A token deleted by another process may then remain valid for this
+        long in this process. Defaults to ``0``, i.e. no cache.
+    token_signer : TokenSigner, optional
+        If given, ``.create_token()`` issues signed tokens, which are
+        verified without accessing the database (see ``api.signing``).
+        Opaque tokens remain valid. Defaults to ``None``.
+    revocation_refresh : float, optional
+        The list of revoked signed tokens is reloaded at most every
+        ``revocation_refresh`` seconds. A signed token revoked by another
+        process may then remain valid for this long in this process.
+        Defaults to ``5``.
+    token_sweep_interval : float, optional
+        If positive, expired tokens are deleted by a background thread
+        every ``token_sweep_interval`` seconds, see
+        ``.sweep_expired_tokens()``. Defaults to ``0``, i.e. never.
+    on_timing : callable, optional
+        Called as ``on_timing("db", seconds)`` with the time spent in each
+        outermost database context, e.g. ``api.metrics.record``.
+        Defaults to ``None``.
+    query_log : QueryLog, optional
+        If given, the execution and fetch time of every statement is
+        recorded per statement template, and slow statements are logged
+        with their query plan, see ``api.querylog``. Statistics are
+        available from ``db.query_log.summary()``. Defaults to ``None``.
     """
 
-    def __init__(self, path: str):
+    def __init__(
+        self,
+        path: str,
+        pool_size: int = 8,
+        pragmas: Optional[Dict[str, Union[str, int]]] = None,
+        tracks_format: str = FORMAT_JSON,
+        compression_level: int = 0,
+        write_behind: float = 0,
+        cache_size: int = 0,
+        token_cache_ttl: float = 0,
+        token_signer: Optional[TokenSigner] = None,
+        revocation_refresh: float = 5,
+        token_sweep_interval: float = 0,
+        on_timing: Optional[Callable[[str, float], None]] = None,
+        query_log: Optional[QueryLog] = None,
+    ):
         self.path = path
-        self.__connections: List[sqlite3.Connection] = []
-        self.__cursors: List[sqlite3.Cursor] = []
+        self.pool_size = pool_size
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.tracks_format = tracks_format
+        self.compression_level = compression_level
+        self.__pool: queue.LifoQueue = queue.LifoQueue(
+            maxsize=max(pool_size, 0)
+        )
+        self.__local = threading.local()
+        self.write_behind = write_behind
+        # Queued songs, along with the parameters of their update.
+        self.__pending: Dict[int, Tuple[dict, tuple]] = {}
+        self.__flushing: Dict[int, Tuple[dict, tuple]] = {}
+        self.__pending_lock = threading.Lock()
+        self.__flush_lock = threading.Lock()
+        self.__writer: Optional[threading.Thread] = None
+        self.__stopping = threading.Event()
+        self.__exit_registered = False
+        self.song_cache = LRUCache(cache_size) if cache_size > 0 else None
+        self.token_cache = (
+            TTLCache(token_cache_ttl) if token_cache_ttl > 0 else None
+        )
+        self.token_signer = token_signer
+        self.revocation_refresh = revocation_refresh
+        self.__revoked: set = set()
+        self.__revoked_loaded = -float("inf")
+        self.token_sweep_interval = token_sweep_interval
+        self.__sweeper: Optional[threading.Thread] = None
+        self.on_timing = on_timing
+        self.query_log = query_log
+
+    # Connection pool.
+    # Connections are created lazily and returned to the pool when released.
+    # The pool only bounds the number of *idle* connections, so nested
+    # database contexts never block waiting for a connection.
+
+    def _connect(self) -> sqlite3.Connection:
+        # Pooled connections may be released by one thread and acquired
+        # by another, so the same-thread check must be disabled. The pool
+        # guarantees a connection is only used by one thread at a time.
+        if self.query_log is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(
+                self.path, check_same_thread=False, factory=TimedConnection
+            )
+            conn.query_log = self.query_log
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self.__pool.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def _release(self, conn: sqlite3.Connection):
+        # Never hand out a connection with a pending transaction.
+        if conn.in_transaction:
+            conn.rollback()
+
+        if self.pool_size <= 0:
+            conn.close()
+            return
+
+        try:
+            self.__pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @contextmanager
+    def _pooled(self) -> Iterator[sqlite3.Connection]:
+        # Acquire a connection without pushing it onto the current thread's
+        # stack. Generators must use this: they may be resumed or closed
+        # from other threads, or after other contexts have been entered.
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def close(self):
+        """Close all idle connections held by the pool.
+
+        Background threads are stopped first. In write-behind mode,
+        pending updates are flushed.
+        """
+        threads = [self.__writer, self.__sweeper]
+        self.__stopping.set()
+        for thread in threads:
+            if thread is not None:
+                thread.join()
+        self.__writer = self.__sweeper = None
+        self.__stopping.clear()
+        self.flush()
+
+        while True:
+            try:
+                conn = self.__pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+
+    # Per-thread stacks of connections and cursors.
+
+    @property
+    def __connections(self) -> List[sqlite3.Connection]:
+        try:
+            return self.__local.connections
+        except AttributeError:
+            self.__local.connections = []
+            return self.__local.connections
+
+    @property
+    def __cursors(self) -> List[sqlite3.Cursor]:
+        try:
+            return self.__local.cursors
+        except AttributeError:
+            self.__local.cursors = []
+            return self.__local.cursors
+
+    @property
+    def __transaction(self) -> Optional[sqlite3.Connection]:
+        return getattr(self.__local, "transaction", None)
 
     # Context manager implementation.
-    # Allows to use `with self:` to acquire a new connection/cursor.
+    # Allows to use `with self:` to acquire a connection/cursor.
     # The connections and cursors are stored in a stack-like manner, so it
     # is safe to enter the database context multiple times
     # (i.e. perform nested queries.)
 
     def __enter__(self):
-        conn = sqlite3.connect(self.path)
+        if self.on_timing is not None and not self.__connections:
+            self.__local.entered = time.perf_counter()
+        # Within a transaction, every context shares its connection.
+        conn = self.__transaction or self._acquire()
         cursor = conn.cursor()
         self.__connections.append(conn)
         self.__cursors.append(cursor)
@@ -63,7 +476,12 @@ class Database:
             self.__cursors.pop().close()
 
         with suppress(IndexError):
-            self.__connections.pop().close()
+            conn = self.__connections.pop()
+            if conn is not self.__transaction:
+                self._release(conn)
+
+        if self.on_timing is not None and not self.__connections:
+            self.on_timing("db", time.perf_counter() - self.__local.entered)
 
     @property
     def cursor(self) -> sqlite3.Cursor:
@@ -101,11 +519,156 @@ class Database:
         """
         return self.__connections[-1]
 
+    # Unit of work.
+    # Methods commit their changes by calling `._commit()`, which is deferred
+    # to the end of the transaction when one is in progress.
+
+    @contextmanager
+    def transaction(self, immediate: bool = True) -> Iterator["Database"]:
+        """Group several method calls into a single transaction.
+
+        Within the transaction, methods called from the current thread
+        use the same connection, and their changes are committed once when
+        the transaction ends. If an exception is raised, all changes are
+        rolled back. Nested transactions are merged into the outermost one.
+
+        The exceptions are the ``.iter_*()`` generators (and the methods
+        built on them, e.g. ``.get_songs_by_user()``), which always use a
+        connection of their own since they may be consumed from elsewhere:
+        they do not see the transaction's uncommitted changes.
+
+        Example::
+
+            with db.transaction():
+                song_id = db.create_song(name, tracks)
+                db.create_song_user_link(song_id, username)
+
+        Parameters
+        ----------
+        immediate : bool, optional
+            Whether to take the database write lock immediately, so that
+            data that was read cannot be modified by others before the
+            transaction ends. Read-only transactions should pass ``False``:
+            their reads then share a consistent snapshot without blocking
+            writers. Writing within such a transaction may fail with
+            "database is locked" if others wrote since it started.
+            Defaults to ``True``.
+
+        Yields
+        ------
+        db : Database
+        """
+        if self.__transaction is not None:
+            yield self
+            return
+
+        conn = self._acquire()
+        self.__local.transaction = conn
+        try:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            with self:
+                yield self
+            conn.commit()
+        finally:
+            self.__local.transaction = None
+            # Rolls back the transaction if it was not committed.
+            self._release(conn)
+
+    def _commit(self):
+        if self.__transaction is None:
+            self.connection.commit()
+
+    # Write-behind.
+    # In write-behind mode, song updates are queued by song ID so that
+    # several updates of the same song are coalesced (the last one wins),
+    # and updates of all songs are written in a single transaction.
+    # Reads of a single song see queued updates; other reads flush them.
+
+    def _queue_update(self, song: dict, params: tuple):
+        with self.__pending_lock:
+            self.__pending[song["id"]] = song, params
+        # The writer is started lazily, i.e. after gunicorn forked workers.
+        if self.__writer is None or not self.__writer.is_alive():
+            self.__writer = threading.Thread(
+                target=self._write_behind, name="db-writer", daemon=True
+            )
+            self.__writer.start()
+            if not self.__exit_registered:
+                atexit.register(self.close)
+                self.__exit_registered = True
+
+    def _pending_song(self, id: int) -> Optional[dict]:
+        with self.__pending_lock:
+            entry = self.__pending.get(id) or self.__flushing.get(id)
+        return None if entry is None else dict(entry[0])
+
+    def _write_behind(self):
+        while not self.__stopping.wait(self.write_behind):
+            try:
+                self.flush()
+            except Exception:
+                # The writer must keep running. Updates are kept and
+                # retried on the next flush.
+                logger.exception("Failed to flush song updates.")
+
+    def flush(self) -> int:
+        """Write pending song updates, in write-behind mode.
+
+        If a flush is in progress (e.g. in the writer thread), it is waited
+        for, so that all updates queued so far are written on return.
+
+        Updates are validated when queued (see ``.update_song()``), so
+        they are never dropped: if the batch cannot be written, e.g. because
+        the database is locked, it is kept and written by the next flush.
+
+        Returns
+        -------
+        count : int
+            The number of songs written.
+        """
+        with self.__flush_lock:
+            with self.__pending_lock:
+                if not self.__pending and not self.__flushing:
+                    return 0
+                batch, self.__pending = self.__pending, {}
+                self.__flushing = batch
+            try:
+                with self.transaction():
+                    self.cursor.executemany(
+                        """
+                        UPDATE songs
+                        SET SongName = ?, Updated = ?, TracksJson = ?,
+                            TrackCount = ?, NoteCount = ?
+                        WHERE SongID = ?
+                        """,
+                        [params for _, params in batch.values()],
+                    )
+            except BaseException:
+                with self.__pending_lock:
+                    # Updates queued in the meantime are more recent.
+                    self.__pending = {**batch, **self.__pending}
+                raise
+            finally:
+                with self.__pending_lock:
+                    self.__flushing = {}
+            for id in batch:
+                self._forget_song(id)
+            return len(batch)
+
+    # Song cache.
+    # Cached songs are checked against their `Updated` date, which catches
+    # writes from other processes; writes from this process also drop them.
+
+    def _forget_song(self, id: int):
+        if self.song_cache is not None:
+            self.song_cache.pop(id)
+
     def generate_schema(self):
         """Generate the database schema.
 
         It is safe to call this multiple times: tables will only be
-        created if they don't exist already.
+        created if they don't exist already, and only pending migrations
+        are applied (see ``.migrate()``).
         """
         with self:
             self.cursor.execute(
@@ -141,9 +704,113 @@ class Database:
             )
             self.connection.commit()
 
+        self.migrate()
+
+    @property
+    def schema_version(self) -> int:
+        """Return the version of the database schema.
+
+        Returns
+        -------
+        version : int
+            The number of migrations applied to the database.
+        """
+        with self:
+            version, = self.cursor.execute("PRAGMA user_version").fetchone()
+            return version
+
+    def migrate(self) -> int:
+        """Apply pending schema migrations.
+
+        Migrations are applied in order within a single transaction, which
+        holds the write lock so that concurrent workers don't apply the
+        same migration twice.
+
+        Returns
+        -------
+        version : int
+            The schema version after migrating.
+        """
+        with self:
+            self.cursor.execute("BEGIN IMMEDIATE")
+            try:
+                version, = self.cursor.execute(
+                    "PRAGMA user_version"
+                ).fetchone()
+                pending = MIGRATIONS[version:]
+                for version, migrate in enumerate(pending, start=version + 1):
+                    migrate(self.cursor)
+                    self.cursor.execute(f"PRAGMA user_version = {version}")
+            except Exception:
+                self.connection.rollback()
+                raise
+            self.connection.commit()
+            return version
+
+    def _encode_tracks(self, tracks: List[dict]) -> bytes:
+        return encode_tracks(
+            tracks, self.tracks_format, self.compression_level
+        )
+
+    def repack_songs(self, batch_size: int = 100) -> int:
+        """Re-encode stored tracks using the current format and compression.
+
+        This converts existing songs after changing ``tracks_format`` or
+        ``compression_level``.
+        Songs are processed in batches, each in its own transaction, so that
+        other writers are never blocked for long. Update dates are left
+        untouched, as songs' contents do not change.
+
+        Parameters
+        ----------
+        batch_size : int, optional
+            The number of songs per transaction. Defaults to ``100``.
+
+        Returns
+        -------
+        count : int
+            The number of songs that were re-encoded.
+        """
+        count = 0
+        last_id = 0
+        self.flush()
+        with self:
+            while True:
+                self.cursor.execute(
+                    """
+                    SELECT SongID, TracksJson FROM songs
+                    WHERE SongID > ?
+                    ORDER BY SongID
+                    LIMIT ?
+                    """,
+                    (last_id, batch_size),
+                )
+                rows = self.cursor.fetchall()
+                if not rows:
+                    return count
+
+                for id, stored in rows:
+                    value = self._encode_tracks(decode_tracks(stored))
+                    if value != stored:
+                        self.cursor.execute(
+                            "UPDATE songs SET TracksJson = ? WHERE SongID = ?",
+                            (value, id),
+                        )
+                        count += 1
+                self.connection.commit()
+                last_id = rows[-1][0]
+
     def remove(self):
-        """Delete the SQLite database file."""
+        """Close pooled connections and delete the SQLite database file.
+
+        The write-ahead log and shared-memory files are deleted as well,
+        if any.
+        """
+        self.close()
         os.remove(self.path)
+        for suffix in ("-wal", "-shm"):
+            with suppress(FileNotFoundError):
+                os.remove(self.path + suffix)
 
     def get_song_by_id(self, id: int) -> dict:
         """Retrieve a song by ID.
@@ -162,6 +829,12 @@ class Database:
         DoesNotExist :
             If no song exists for the given ``id``.
         """
+        pending = self._pending_song(id)
+        if pending is not None:
+            return pending
+        if self.song_cache is not None:
+            return codec.loads(self.get_song_json(id))
+
         with self:
             self.cursor.execute(
                 """
@@ -181,43 +854,359 @@ class Database:
                     "name": name,
                     "created": str(created),
                     "updated": str(updated),
-                    "tracks": json.loads(tracks),
+                    "tracks": decode_tracks(tracks),
                 }
 
-    def get_songs_by_user(self, username: str) -> List[dict]:
-        """Return the list of songs for a given user.
+    def get_song_json(self, id: int) -> bytes:
+        """Retrieve a song by ID, as JSON.
+
+        The result is the same as encoding ``.get_song_by_id()`` with
+        ``api.codec``. However, when tracks are stored as JSON, they are
+        spliced into the result as-is instead of being decoded and
+        re-encoded.
 
         Parameters
         ----------
-        username : str
+        id : int
+            The ID of the song.
 
         Returns
         -------
-        songs : list of dict
+        song : bytes
+
+        Raises
+        ------
+        DoesNotExist :
+            If no song exists for the given ``id``.
+        """
+        data, _ = self.get_song_json_and_updated(id)
+        return data
+
+    def get_song_json_and_updated(self, id: int) -> Tuple[bytes, str]:
+        """Retrieve a song by ID, as JSON, along with its update date.
+
+        Both are read together, so that the date always matches the song,
+        even if it is being modified concurrently. With a song cache, only
+        the update date is read from the database when the song is cached.
+
+        Parameters
+        ----------
+        id : int
+            The ID of the song.
+
+        Returns
+        -------
+        result : tuple of (bytes, str)
+            The song, as returned by ``.get_song_json()``, and the date it
+            was last updated.
+
+        Raises
+        ------
+        DoesNotExist :
+            If no song exists for the given ``id``.
         """
+        pending = self._pending_song(id)
+        if pending is not None:
+            return codec.dumps(pending), pending["updated"]
+
+        if self.song_cache is not None:
+            # Songs may have been modified by other processes: the cached
+            # song is only used if it was last updated at the same date.
+            updated = self.get_song_updated(id)
+            data = self.song_cache.get(id, updated)
+            if data is not None:
+                return data, updated
+
         with self:
             self.cursor.execute(
                 """
-                SELECT songs.SongID, SongName, Created, Updated, TracksJson
-                FROM songs, song_user_links
-                ON songs.SongID = song_user_links.SongID
-                WHERE UserName = ?
+                SELECT SongID, SongName, Created, Updated, TracksJson
+                FROM songs
+                WHERE SongID = ?
                 """,
-                (username,),
+                (id,),
             )
-            rows = self.cursor.fetchall()
-            return [
-                {
+            try:
+                id, name, created, updated, tracks = self.cursor.fetchone()
+            except TypeError:
+                raise DoesNotExist("Song", id=id)
+
+        head = codec.dumps(
+            {
+                "id": id,
+                "name": name,
+                "created": str(created),
+                "updated": str(updated),
+            }
+        )
+        # Replace the closing brace with the tracks.
+        data = b"".join(
+            (head[:-1], b',"tracks":', tracks_json(tracks), b"}")
+        )
+        if self.song_cache is not None:
+            self.song_cache.put(id, str(updated), data, len(data))
+        return data, str(updated)
+
+    def get_songs_by_ids(self, ids: List[int]) -> List[dict]:
+        """Retrieve several songs at once.
+
+        Songs are fetched with a single query.
+
+        Parameters
+        ----------
+        ids : list of int
+            IDs of the songs. There should be at most a few hundred of them.
+
+        Returns
+        -------
+        songs : list of dict
+            Songs in the order of ``ids``. IDs of songs that do not exist
+            are ignored.
+        """
+        if not ids:
+            return []
+
+        with self:
+            placeholders = ",".join("?" * len(ids))
+            self.cursor.execute(
+                f"""
+                SELECT SongID, SongName, Created, Updated, TracksJson
+                FROM songs
+                WHERE SongID IN ({placeholders})
+                """,
+                ids,
+            )
+            songs = {
+                id: {
                     "id": id,
                     "name": name,
                     "created": str(created),
                     "updated": str(updated),
-                    "tracks": json.loads(tracks),
+                    "tracks": decode_tracks(tracks),
                 }
-                for id, name, created, updated, tracks in rows
-            ]
+                for id, name, created, updated, tracks in self.cursor
+            }
+        for id in ids:
+            pending = self._pending_song(id)
+            if pending is not None:
+                songs[id] = pending
+        return [songs[id] for id in dict.fromkeys(ids) if id in songs]
+
+    def get_song_updated(self, id: int) -> str:
+        """Return the date a song was last updated.
+
+        This is a cheap way to know whether a song has changed, as the
+        song's tracks are not read.
+
+        Parameters
+        ----------
+        id : int
+            The ID of the song.
+
+        Returns
+        -------
+        updated : str
+
+        Raises
+        ------
+        DoesNotExist :
+            If no song exists for the given ``id``.
+        """
+        pending = self._pending_song(id)
+        if pending is not None:
+            return pending["updated"]
+
+        with self:
+            self.cursor.execute(
+                "SELECT Updated FROM songs WHERE SongID = ?", (id,)
+            )
+            row = self.cursor.fetchone()
+            if row is None:
+                raise DoesNotExist("Song", id=id)
+            return str(row[0])
+
+    def get_songs_version_by_user(self, username: str) -> Tuple[int, str]:
+        """Return a marker that changes whenever a user's songs change.
+
+        The version is maintained by triggers when songs are added,
+        modified or removed, so only a single row is read, whatever the
+        number of songs.
+
+        Parameters
+        ----------
+        username : str
+
+        Returns
+        -------
+        version : tuple of (int, str)
+            The version of the user's list of songs (``0`` if the user never
+            had any song), and the date the most recently updated song was
+            updated (an empty string if unknown).
+        """
+        self.flush()
+        with self:
+            self.cursor.execute(
+                """
+                SELECT Version, Updated FROM user_versions
+                WHERE UserName = ?
+                """,
+                (username,),
+            )
+            row = self.cursor.fetchone()
+        if row is None:
+            return 0, ""
+        version, updated = row
+        return version, str(updated or "")
+
+    def iter_songs_by_user(
+        self,
+        username: str,
+        limit: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> Iterator[dict]:
+        """Iterate over the songs of a given user.
+
+        Songs are ordered by ID. Pages are selected using keyset pagination,
+        so fetching a page costs the same regardless of its position.
+
+        Rows are fetched from the database lazily, one song at a time,
+        so that the full list never has to be held in memory.
+
+        Parameters
+        ----------
+        username : str
+        limit : int, optional
+            The maximum number of songs to return. All songs are returned
+            if not given.
+        after : int, optional
+            Only return songs whose ID is greater than this one, i.e. the
+            songs following the last song of the previous page.
+
+        Yields
+        ------
+        song : dict
+        """
+        self.flush()
+        with self._pooled() as conn:
+            cursor = conn.execute(
+                """
+                SELECT songs.SongID, SongName, Created, Updated, TracksJson
+                FROM song_user_links, songs
+                ON songs.SongID = song_user_links.SongID
+                WHERE UserName = ?
+                AND song_user_links.SongID > ?
+                ORDER BY song_user_links.SongID
+                LIMIT ?
+                """,
+                (username, after or 0, -1 if limit is None else limit),
+            )
+            try:
+                for id, name, created, updated, tracks in cursor:
+                    yield {
+                        "id": id,
+                        "name": name,
+                        "created": str(created),
+                        "updated": str(updated),
+                        "tracks": decode_tracks(tracks),
+                    }
+            finally:
+                cursor.close()
+
+    def get_songs_by_user(
+        self,
+        username: str,
+        limit: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> List[dict]:
+        """Return the list of songs for a given user.
+
+        Parameters
+        ----------
+        username : str
+        limit : int, optional
+        after : int, optional
+            See ``.iter_songs_by_user()``.
+
+        Returns
+        -------
+        songs : list of dict
+        """
+        return list(self.iter_songs_by_user(username, limit, after))
 
-    def create_song(self, name: str, tracks: List[dict]) -> int:
+    def iter_song_summaries_by_user(
+        self,
+        username: str,
+        limit: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> Iterator[dict]:
+        """Iterate over the song summaries of a given user.
+
+        Summaries do not contain tracks, which are neither read nor decoded.
+        Instead, they contain the number of tracks and notes of each song.
+
+        Parameters
+        ----------
+        username : str
+        limit : int, optional
+        after : int, optional
+            See ``.iter_songs_by_user()``.
+
+        Yields
+        ------
+        summary : dict
+        """
+        self.flush()
+        with self._pooled() as conn:
+            cursor = conn.execute(
+                """
+                SELECT songs.SongID, SongName, Created, Updated,
+                    TrackCount, NoteCount
+                FROM song_user_links, songs
+                ON songs.SongID = song_user_links.SongID
+                WHERE UserName = ?
+                AND song_user_links.SongID > ?
+                ORDER BY song_user_links.SongID
+                LIMIT ?
+                """,
+                (username, after or 0, -1 if limit is None else limit),
+            )
+            try:
+                for id, name, created, updated, tracks, notes in cursor:
+                    yield {
+                        "id": id,
+                        "name": name,
+                        "created": str(created),
+                        "updated": str(updated),
+                        "track_count": tracks,
+                        "note_count": notes,
+                    }
+            finally:
+                cursor.close()
+
+    def get_song_summaries_by_user(
+        self,
+        username: str,
+        limit: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> List[dict]:
+        """Return the list of song summaries for a given user.
+
+        Parameters
+        ----------
+        username : str
+        limit : int, optional
+        after : int, optional
+            See ``.iter_songs_by_user()``.
+
+        Returns
+        -------
+        summaries : list of dict
+        """
+        return list(self.iter_song_summaries_by_user(username, limit, after))
+
+    def create_song(
+        self, name: str, tracks: List[dict], id: Optional[int] = None
+    ) -> int:
         """Save a new song to the database.
 
         Parameters
@@ -226,6 +1215,9 @@ class Database:
             The name of the song.
         tracks : list of dict
             A list of JSON-serializable dictionaries.
+        id : int, optional
+            The ID of the new song. Defaults to ``None``, i.e. SQLite picks
+            the next ID.
 
         Returns
         -------
@@ -237,24 +1229,71 @@ class Database:
             now = datetime.datetime.now()
             self.cursor.execute(
                 """
-                INSERT INTO songs (SongName, Created, Updated, TracksJson)
-                VALUES (?,?,?,?)
+                INSERT INTO songs (
+                    SongID, SongName, Created, Updated, TracksJson,
+                    TrackCount, NoteCount
+                )
+                VALUES (?,?,?,?,?,?,?)
                 """,
-                (name, now, now, json.dumps(tracks)),
+                (
+                    id,
+                    name,
+                    now,
+                    now,
+                    self._encode_tracks(tracks),
+                    *count_notes(tracks),
+                ),
             )
-            self.connection.commit()
-            self.cursor.execute(
-                "SELECT SongID FROM songs WHERE Created = ? AND SongName = ?",
-                (now, name),
-            )
-            row_id: int = self.cursor.fetchall()[0][0]
+            row_id: int = self.cursor.lastrowid
+            self._commit()
             return row_id
 
+    def create_songs(self, songs: List[dict], username: str) -> List[int]:
+        """Save several new songs for a user at once.
+
+        Songs and their links to the user are saved within a single
+        transaction, so that either all or none of them are created.
+
+        Parameters
+        ----------
+        songs : list of dict
+            Songs, as dictionaries with ``name`` and ``tracks``.
+        username : str
+            The user the songs belong to.
+
+        Returns
+        -------
+        song_ids : list of int
+            IDs of the songs newly created, in the order of ``songs``.
+        """
+        with self.transaction():
+            # NOTE: a multi-row `INSERT` cannot return the IDs of new rows
+            # with older SQLite versions (without `RETURNING`), so rows are
+            # inserted one at a time. What matters is that there is only
+            # one transaction.
+            song_ids = [
+                self.create_song(song["name"], song["tracks"])
+                for song in songs
+            ]
+            with self:
+                self.cursor.executemany(
+                    """
+                    INSERT INTO song_user_links (SongID, UserName)
+                    VALUES (?,?)
+                    """,
+                    [(song_id, username) for song_id in song_ids],
+                )
+            return song_ids
+
     def update_song(
         self, id: int, name: str, tracks: List[dict], username: str
     ) -> dict:
         """Update a song.
 
+        In write-behind mode (outside of a transaction), the update is
+        queued and written later, together with updates of other songs.
+        Queued updates of the same song are coalesced.
+
         Parameters
         ----------
         id : int
@@ -274,11 +1313,17 @@ class Database:
         ------
         DoesNotExist :
             If the user ``username`` has no song with id ``id``.
+        TypeError :
+            If ``name`` is not a string. This is checked before the update
+            is queued, so that queued updates can always be written.
         """
+        if not isinstance(name, str):
+            raise TypeError("A song's name must be a string.")
+
         with self:
             self.cursor.execute(
                 """
-                SELECT songs.SongID
+                SELECT songs.SongID, Created
                 FROM songs, song_user_links
                 ON songs.SongID = song_user_links.SongID
                 WHERE songs.SongID = ?
@@ -286,19 +1331,132 @@ class Database:
                 """,
                 (id, username),
             )
-            if self.cursor.fetchone() is None:
+            row = self.cursor.fetchone()
+            if row is None:
                 raise DoesNotExist("Song", id=id, username=username)
 
             now = datetime.datetime.now()
+            if self.write_behind > 0 and self.__transaction is None:
+                song = {
+                    "id": id,
+                    "name": name,
+                    "created": str(row[1]),
+                    "updated": str(now),
+                    "tracks": tracks,
+                }
+                # Tracks are encoded and counted before queueing, so that
+                # invalid tracks fail this update rather than the flush,
+                # which would lose it after it was acknowledged.
+                params = (
+                    name,
+                    song["updated"],
+                    self._encode_tracks(tracks),
+                    *count_notes(tracks),
+                    id,
+                )
+                self._queue_update(song, params)
+                self._forget_song(id)
+                return dict(song)
+
             self.cursor.execute(
                 """
                 UPDATE songs
-                SET SongName = ?, Updated = ?, TracksJson = ?
+                SET SongName = ?, Updated = ?, TracksJson = ?,
+                    TrackCount = ?, NoteCount = ?
                 WHERE SongID = ?
                 """,
-                (name, now, json.dumps(tracks), id),
+                (
+                    name,
+                    now,
+                    self._encode_tracks(tracks),
+                    *count_notes(tracks),
+                    id,
+                ),
             )
-            self.connection.commit()
+            self._commit()
+            self._forget_song(id)
+            return self.get_song_by_id(id)
+
+    def patch_song(self, id: int, patch: List[dict], username: str) -> dict:
+        """Apply a JSON Patch to a song.
+
+        The patch is applied to a document with the song's ``name`` and
+        ``tracks``, e.g. ``{"op": "replace", "path": "/tracks/0/notes/3/time",
+        "value": 12}``. Reading, patching and saving the song happens
+        within a single transaction.
+
+        Parameters
+        ----------
+        id : int
+            The ID of the song to patch.
+        patch : list of dict
+            A list of JSON Patch (RFC 6902) operations.
+        username : str
+            The user this song belongs to.
+
+        Returns
+        -------
+        song : dict
+
+        Raises
+        ------
+        DoesNotExist :
+            If the user ``username`` has no song with id ``id``.
+        PatchError :
+            If the patch could not be applied, or if the patched song
+            is invalid.
+        """
+        self.flush()
+        with self:
+            # Take the write lock now so that the song cannot be modified
+            # by another request between reading and writing it.
+            if not self.connection.in_transaction:
+                self.cursor.execute("BEGIN IMMEDIATE")
+            self.cursor.execute(
+                """
+                SELECT SongName, TracksJson
+                FROM songs, song_user_links
+                ON songs.SongID = song_user_links.SongID
+                WHERE songs.SongID = ?
+                AND song_user_links.UserName = ?
+                """,
+                (id, username),
+            )
+            row = self.cursor.fetchone()
+            if row is None:
+                raise DoesNotExist("Song", id=id, username=username)
+
+            name, tracks = row
+            song = {"name": name, "tracks": decode_tracks(tracks)}
+            song = apply_patch(song, patch)
+
+            if (
+                not isinstance(song, dict)
+                or set(song) != {"name", "tracks"}
+                or not isinstance(song["tracks"], list)
+            ):
+                raise PatchError(
+                    "A song must only have a 'name' and a list of 'tracks'."
+                )
+
+            now = datetime.datetime.now()
+            self.cursor.execute(
+                """
+                UPDATE songs
+                SET SongName = ?, Updated = ?, TracksJson = ?,
+                    TrackCount = ?, NoteCount = ?
+                WHERE SongID = ?
+                """,
+                (
+                    song["name"],
+                    now,
+                    self._encode_tracks(song["tracks"]),
+                    *count_notes(song["tracks"]),
+                    id,
+                ),
+            )
+            self._commit()
+            self._forget_song(id)
             return self.get_song_by_id(id)
 
     def delete_song(self, id: int, username: str):
@@ -316,6 +1474,7 @@ class Database:
         DoesNotExist :
             If no song exists for ``id`` and ``username``.
         """
+        self.flush()
         with self:
             self.cursor.execute(
                 """
@@ -334,7 +1493,8 @@ class Database:
             self.cursor.execute(
                 "DELETE FROM song_user_links WHERE SongID = ?", (id,)
             )
-            self.connection.commit()
+            self._commit()
+            self._forget_song(id)
 
     def user_exists(self, username: str) -> bool:
         """Return whether a user already exists in the database.
@@ -373,7 +1533,7 @@ class Database:
                             VALUES (?,?,?,?)""",
                 (username, first_name, last_name, password),
             )
-            self.connection.commit()
+            self._commit()
 
     def get_user(self, username: str) -> dict:
         """Retrieve a user.
@@ -418,7 +1578,27 @@ class Database:
                 """,
                 (song_id, username),
             )
-            self.connection.commit()
+            self._commit()
+
+    def create_token(self, username: str) -> str:
+        """Issue a new token for a user.
+
+        With a ``token_signer``, the token is a signed token and nothing is
+        written to the database. Otherwise, an opaque token is saved.
+
+        Parameters
+        ----------
+        username : str
+
+        Returns
+        -------
+        token : str
+        """
+        if self.token_signer is not None:
+            return self.token_signer.sign(username)
+        token = str(uuid.uuid4())
+        self.save_token(username, token)
+        return token
 
     def save_token(self, username: str, token: str):
         """Save a new token to the database.
@@ -431,7 +1611,7 @@ class Database:
         token : str
         """
         with self:
-            refresh = datetime.datetime.now() + datetime.timedelta(minutes=15)
+            refresh = datetime.datetime.now() + TOKEN_LIFETIME
             self.cursor.execute(
                 """
                 INSERT INTO tokens (Token, UserName, RefreshDate)
@@ -439,11 +1619,16 @@ class Database:
                 """,
                 (token, username, refresh),
             )
-            self.connection.commit()
+            self._commit()
 
     def reverse_token(self, token: str) -> Optional[str]:
         """Retrieve the username corresponding to a token, if any.
 
+        Tokens expire after their refresh date. Using a token pushes its
+        refresh date back to 15mins ahead from now (once half of that time
+        has passed). With a token cache (see ``token_cache_ttl``), cache
+        hits do not access the database.
+
         Parameters
         ----------
         token : str
@@ -451,22 +1636,146 @@ class Database:
         Returns
         -------
         username : str or None
-            This is ``None`` if ``token`` does not correspond to any user.
+            This is ``None`` if ``token`` does not correspond to any user,
+            or if it has expired.
         """
+        if self.token_sweep_interval > 0:
+            self._start_token_sweeper()
+
+        if is_signed(token):
+            return self._verify_signed_token(token)
+
+        if self.token_cache is not None:
+            username = self.token_cache.get(token)
+            if username is not None:
+                return username
+
+        now = datetime.datetime.now()
         with self:
             self.cursor.execute(
-                "SELECT UserName FROM tokens WHERE Token=?", (token,)
+                "SELECT UserName, RefreshDate FROM tokens WHERE Token=?",
+                (token,),
             )
-            result = self.cursor.fetchall()
-            try:
-                username = result[0][0]
-                return username
-            except IndexError:
+            row = self.cursor.fetchone()
+            if row is None:
                 return None
 
+            username, refresh = row
+            refresh = datetime.datetime.fromisoformat(str(refresh))
+            if refresh <= now:
+                return None
+
+            # Only push the refresh date back once half of the token's
+            # lifetime has passed, so that most lookups do not write.
+            if refresh - now < TOKEN_LIFETIME / 2:
+                refresh = now + TOKEN_LIFETIME
+                self.cursor.execute(
+                    "UPDATE tokens SET RefreshDate = ? WHERE Token = ?",
+                    (refresh, token),
+                )
+                self._commit()
+
+        if self.token_cache is not None:
+            self.token_cache.put(
+                token, username, (refresh - now).total_seconds()
+            )
+        return username
+
+    def _verify_signed_token(self, token: str) -> Optional[str]:
+        if self.token_signer is None:
+            return None
+        claims = self.token_signer.verify(token)
+        if claims is None or claims.id in self._revoked_token_ids():
+            return None
+        return claims.username
+
+    def _revoked_token_ids(self) -> set:
+        # Revocations by other processes are picked up at most
+        # `revocation_refresh` seconds later. Revocations by this process
+        # are added right away, see `.delete_token()`.
+        now = time.monotonic()
+        if now - self.__revoked_loaded >= self.revocation_refresh:
+            with self:
+                self.cursor.execute(
+                    "SELECT TokenID FROM revoked_tokens WHERE Expires > ?",
+                    (datetime.datetime.now(),),
+                )
+                self.__revoked = {row[0] for row in self.cursor}
+            self.__revoked_loaded = now
+        return self.__revoked
+
+    def sweep_expired_tokens(
+        self, batch_size: int = 500, pause: float = 0
+    ) -> Tuple[int, float]:
+        """Delete expired tokens, and revocations of expired signed tokens.
+
+        Tokens are deleted in batches, each in its own transaction, so that
+        other writers are not blocked for long.
+
+        Parameters
+        ----------
+        batch_size : int, optional
+            The maximum number of tokens deleted per transaction.
+            Defaults to ``500``.
+        pause : float, optional
+            Time to wait between batches, in seconds, to let other writers
+            through. Defaults to ``0``.
+
+        Returns
+        -------
+        result : tuple of (int, float)
+            The number of rows deleted, and the time it took in seconds.
+        """
+        start = time.perf_counter()
+        now = datetime.datetime.now()
+        count = 0
+        for table, column in (
+            ("tokens", "RefreshDate"),
+            ("revoked_tokens", "Expires"),
+        ):
+            while True:
+                with self:
+                    deleted = self.cursor.execute(
+                        f"""
+                        DELETE FROM {table} WHERE rowid IN (
+                            SELECT rowid FROM {table}
+                            WHERE {column} <= ?
+                            LIMIT ?
+                        )
+                        """,
+                        (now, batch_size),
+                    ).rowcount
+                    self._commit()
+                count += deleted
+                if deleted < batch_size:
+                    break
+                time.sleep(pause)
+        return count, time.perf_counter() - start
+
+    def _start_token_sweeper(self):
+        # Started lazily, i.e. after gunicorn forked workers.
+        if self.__sweeper is None or not self.__sweeper.is_alive():
+            self.__sweeper = threading.Thread(
+                target=self._sweep_tokens, name="db-token-sweeper", daemon=True
+            )
+            self.__sweeper.start()
+
+    def _sweep_tokens(self):
+        while not self.__stopping.wait(self.token_sweep_interval):
+            try:
+                count, elapsed = self.sweep_expired_tokens(pause=0.01)
+            except sqlite3.Error:
+                logger.exception("Failed to delete expired tokens.")
+            else:
+                logger.info(
+                    "Deleted %d expired token(s) in %.3fs.", count, elapsed
+                )
+
     def delete_token(self, token: str):
         """Delete a token from the database.
 
+        Signed tokens are revoked until they expire.
+
         Parameters
         ----------
         token : str
@@ -476,13 +1785,34 @@ class Database:
         DoesNotExist :
             If no token identified by ``token`` exists.
         """
+        if is_signed(token):
+            claims = self.token_signer and self.token_signer.verify(token)
+            if not claims:
+                raise DoesNotExist("Token", token=token)
+            with self:
+                self.cursor.execute(
+                    """
+                    INSERT OR IGNORE INTO revoked_tokens (TokenID, Expires)
+                    VALUES (?,?)
+                    """,
+                    (
+                        claims.id,
+                        datetime.datetime.fromtimestamp(claims.expires),
+                    ),
+                )
+                self._commit()
+            self.__revoked.add(claims.id)
+            return
+
         with self:
             count = self.cursor.execute(
                 """DELETE FROM tokens WHERE Token = ?""", (token,)
             ).rowcount
+            if self.token_cache is not None:
+                self.token_cache.pop(token)
             if count == 0:
                 raise DoesNotExist("Token", token=token)
-            self.connection.commit()
+            self._commit()
 
     def check_user(self, username: str, password: str) -> bool:
         """Check that the given credentials match those stored in database.
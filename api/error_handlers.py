@@ -1,11 +1,29 @@
 # Custom Falcon error handlers.
 # See: https://falcon.readthedocs.io/en/stable/api/api.html#falcon.API.add_error_handler
+# Handlers take `(req, resp, ex, params)`, as expected by Falcon 2.
 
 import falcon
 
 from .db import DoesNotExist
+from .jsonpatch import InvalidPatch, PatchConflict, PatchError
 
 
-def on_does_not_exist(exc: DoesNotExist, *args):
+def on_does_not_exist(req, resp, ex: DoesNotExist, params):
     """Return a 404 error page when a database object was not found."""
-    raise falcon.HTTPNotFound(title=exc.message)
+    raise falcon.HTTPNotFound(title=ex.message)
+
+
+def on_patch_error(req, resp, ex: PatchError, params):
+    """Return an error response when a JSON Patch could not be applied.
+
+    As recommended by RFC 5789:
+
+    - Malformed patches result in ``400 Bad Request``.
+    - Failed ``test`` operations result in ``409 Conflict``.
+    - Other errors result in ``422 Unprocessable Entity``.
+    """
+    if isinstance(ex, InvalidPatch):
+        raise falcon.HTTPBadRequest(title=ex.message)
+    if isinstance(ex, PatchConflict):
+        raise falcon.HTTPConflict(title=ex.message)
+    raise falcon.HTTPUnprocessableEntity(title=ex.message)
@@ -2,28 +2,46 @@
 
 # API specification: https://hackmd.io/eNiNVR6eR1mJH2kOebtE5g#
 
-from falcon import API
+from typing import Optional
+
+from falcon import API, MEDIA_JSON, media
 from falcon_cors import CORS
 
+from . import codec
 from .db import Database, DoesNotExist
-from .resources.songs import UserSongsResource, SongResource
+from .resources.songs import (
+    SongBatchResource,
+    SongResource,
+    UserSongsResource,
+)
 from .resources.tokens import TokenResource
 from .resources.users import UserResource
-from .error_handlers import on_does_not_exist
+from .error_handlers import on_does_not_exist, on_patch_error
+from .jsonpatch import MEDIA_JSON_PATCH, PatchError
+from .metrics import Metrics, MetricsMiddleware, MetricsResource, timed
 
 
-def create_api(db: Database) -> API:
+def create_api(db: Database, metrics: Optional[Metrics] = None) -> API:
     """Create a new application instance.
 
     - For simplicity, CORS is enabled for all origins,
-      all methods and all headers.
+      all methods and all headers. The ``Link`` (pagination) and ``ETag``
+      (conditional requests) response headers are exposed to clients.
     - ``DoesNotExist`` exceptions are caught and converted
       to ``404 Not Found`` error responses.
+    - ``PatchError`` exceptions are caught and converted to
+      ``400``, ``409`` or ``422`` error responses.
+    - JSON request and response bodies, including JSON Patch
+      (``application/json-patch+json``) request bodies, are handled
+      by ``api.codec``.
+    - If ``metrics`` are given, request metrics are recorded and exposed
+      at ``/metrics`` (see ``api.metrics``).
 
     Parameters
     ----------
     db : Database
         An instance of the ``Database``.
+    metrics : Metrics, optional
     
     Returns
     -------
@@ -31,27 +49,49 @@ def create_api(db: Database) -> API:
     """
     # Middleware.
     cors = CORS(
-        allow_all_origins=True, allow_all_methods=True, allow_all_headers=True
+        allow_all_origins=True,
+        allow_all_methods=True,
+        allow_all_headers=True,
+        expose_headers_list=["Link", "ETag"],
     )
 
+    middleware = [cors.middleware]
+    if metrics is not None:
+        middleware.append(MetricsMiddleware(metrics))
+
     # Application instance.
-    api = API(middleware=[cors.middleware])
+    api = API(middleware=middleware)
+
+    # Media handlers.
+    dumps, loads = codec.dumps, codec.loads
+    if metrics is not None:
+        dumps, loads = timed("json", dumps), timed("json", loads)
+    json_handler = media.JSONHandler(dumps=dumps, loads=loads)
+    api.req_options.media_handlers.update(
+        {MEDIA_JSON: json_handler, MEDIA_JSON_PATCH: json_handler}
+    )
+    api.resp_options.media_handlers[MEDIA_JSON] = json_handler
 
     # Error handlers.
     api.add_error_handler(DoesNotExist, on_does_not_exist)
+    api.add_error_handler(PatchError, on_patch_error)
 
     # Resources.
     users = UserResource(db)
     user_songs = UserSongsResource(db)
     song = SongResource(db)
+    song_batch = SongBatchResource(db)
     token = TokenResource(db)
 
     # Routes.
     api.add_route("/users/", users)
     api.add_route("/users/{username}/songs", user_songs)
+    api.add_route("/songs/batch", song_batch)
     api.add_route("/songs/{pk}", song)
     api.add_route("/songs/", song)
     api.add_route("/tokens/{token}", token)
     api.add_route("/tokens/", token)
+    if metrics is not None:
+        api.add_route("/metrics", MetricsResource(metrics))
 
     return api
@@ -0,0 +1,184 @@
+"""Minimal implementation of JSON Patch (RFC 6902).
+
+See: https://tools.ietf.org/html/rfc6902
+"""
+
+import copy
+from typing import Any, List, Tuple, Union
+
+# Media type of JSON Patch documents.
+MEDIA_JSON_PATCH = "application/json-patch+json"
+
+
+class PatchError(Exception):
+    """Raised when a patch cannot be applied to a document.
+
+    Parameters
+    ----------
+    message : str
+    """
+
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(message)
+
+
+class InvalidPatch(PatchError):
+    """Raised when a patch document is malformed."""
+
+
+class PatchConflict(PatchError):
+    """Raised when a ``test`` operation fails."""
+
+
+def _parse_pointer(pointer: Any) -> List[str]:
+    # See: https://tools.ietf.org/html/rfc6901
+    if not isinstance(pointer, str) or (pointer and pointer[0] != "/"):
+        raise InvalidPatch(f"Invalid JSON pointer: {pointer!r}.")
+    if not pointer:
+        return []
+    return [
+        token.replace("~1", "/").replace("~0", "~")
+        for token in pointer[1:].split("/")
+    ]
+
+
+def _index(container: list, token: str, pointer: str, append=False) -> int:
+    if append and token == "-":
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token[0] == "0"):
+        raise PatchError(f"Invalid array index in {pointer!r}.")
+    index = int(token)
+    if index > len(container) or (not append and index == len(container)):
+        raise PatchError(f"Array index out of range in {pointer!r}.")
+    return index
+
+
+def _resolve(document: Any, pointer: str) -> Tuple[Any, Union[str, None]]:
+    # Return the container of the value referenced by `pointer`,
+    # and the last token of the pointer (`None` for the root).
+    tokens = _parse_pointer(pointer)
+    if not tokens:
+        return None, None
+
+    container = document
+    for token in tokens[:-1]:
+        if isinstance(container, dict):
+            if token not in container:
+                raise PatchError(f"Path does not exist: {pointer!r}.")
+            container = container[token]
+        elif isinstance(container, list):
+            container = container[_index(container, token, pointer)]
+        else:
+            raise PatchError(f"Path does not exist: {pointer!r}.")
+
+    if not isinstance(container, (dict, list)):
+        raise PatchError(f"Path does not exist: {pointer!r}.")
+
+    return container, tokens[-1]
+
+
+def _get(document: Any, pointer: str) -> Any:
+    container, token = _resolve(document, pointer)
+    if token is None:
+        return document
+    if isinstance(container, dict):
+        if token not in container:
+            raise PatchError(f"Path does not exist: {pointer!r}.")
+        return container[token]
+    return container[_index(container, token, pointer)]
+
+
+def _add(document: Any, pointer: str, value: Any) -> Any:
+    container, token = _resolve(document, pointer)
+    if token is None:
+        return value
+    if isinstance(container, dict):
+        container[token] = value
+    else:
+        container.insert(_index(container, token, pointer, True), value)
+    return document
+
+
+def _remove(document: Any, pointer: str) -> Tuple[Any, Any]:
+    container, token = _resolve(document, pointer)
+    if token is None:
+        raise PatchError("Cannot remove the root of the document.")
+    if isinstance(container, dict):
+        if token not in container:
+            raise PatchError(f"Path does not exist: {pointer!r}.")
+        return document, container.pop(token)
+    return document, container.pop(_index(container, token, pointer))
+
+
+def apply_patch(document: Any, patch: Any) -> Any:
+    """Apply a JSON Patch to a document.
+
+    The document is modified in place, so that large documents don't need
+    to be copied. If an error is raised, the document may have been
+    partially patched and should be discarded.
+
+    Parameters
+    ----------
+    document : any
+        A JSON-compatible document.
+    patch : list of dict
+        A list of JSON Patch operations.
+
+    Returns
+    -------
+    patched : any
+        The patched document.
+
+    Raises
+    ------
+    InvalidPatch :
+        If the patch is malformed.
+    PatchConflict :
+        If a ``test`` operation failed.
+    PatchError :
+        If an operation could not be applied, e.g. because its path does
+        not exist.
+    """
+    if not isinstance(patch, list):
+        raise InvalidPatch("A patch must be a list of operations.")
+
+    for operation in patch:
+        if not isinstance(operation, dict):
+            raise InvalidPatch("An operation must be an object.")
+
+        op = operation.get("op")
+        path = operation.get("path")
+        _parse_pointer(path)
+
+        if op in ("add", "replace", "test") and "value" not in operation:
+            raise InvalidPatch(f"'value' is required for '{op}' operations.")
+        if op in ("move", "copy"):
+            _parse_pointer(operation.get("from"))
+
+        if op == "add":
+            document = _add(document, path, operation["value"])
+        elif op == "remove":
+            document, _ = _remove(document, path)
+        elif op == "replace":
+            if _parse_pointer(path):
+                document, _ = _remove(document, path)
+            document = _add(document, path, operation["value"])
+        elif op == "move":
+            source = operation["from"]
+            if path.startswith(source + "/"):
+                raise PatchError(
+                    "Cannot move a value into one of its children."
+                )
+            document, value = _remove(document, source)
+            document = _add(document, path, value)
+        elif op == "copy":
+            value = copy.deepcopy(_get(document, operation["from"]))
+            document = _add(document, path, value)
+        elif op == "test":
+            if _get(document, path) != operation["value"]:
+                raise PatchConflict(f"Test failed for {path!r}.")
+        else:
+            raise InvalidPatch(f"Unknown operation: {op!r}.")
+
+    return document
@@ -0,0 +1,404 @@
+"""Request metrics, exposed in the Prometheus text format.
+
+The following metrics are recorded, by route (URI template) and method:
+
+- ``polyphona_requests_total``: requests, also by status code.
+- ``polyphona_request_duration_seconds``: a histogram of the time spent
+  handling requests (excluding the streaming of streamed responses).
+- ``polyphona_response_size_bytes``: a histogram of response body sizes.
+- ``polyphona_request_phase_seconds_total``: time spent in each ``phase``
+  of requests: ``auth`` (``@authenticated``), ``db`` (the database layer)
+  and ``json`` (request and response bodies). Phases may overlap, e.g.
+  ``auth`` includes the database lookup of the token.
+
+With several worker processes, each worker periodically saves its metrics
+to its own file in a shared directory (from a background thread, so that
+idle workers save their last requests too, and once more at exit), and
+metrics are summed over all files when rendered. Files of workers that exited are kept, so that
+counters never go backwards. Files are named after the worker's PID and a
+random suffix, so that a worker reusing the PID of an exited one does not
+overwrite its file.
+"""
+
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds of histogram buckets.
+DURATION_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+SIZE_BUCKETS = tuple(2 ** power for power in range(6, 26, 2))
+
+Labels = Tuple[Tuple[str, str], ...]
+
+logger = logging.getLogger(__name__)
+
+# Time spent in each phase of the request being handled by this thread.
+_local = threading.local()
+
+
+def record(phase: str, seconds: float):
+    """Attribute time to a phase of the current request, if any.
+
+    Parameters
+    ----------
+    phase : str
+    seconds : float
+    """
+    phases = getattr(_local, "phases", None)
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def track(phase: str) -> Iterator[None]:
+    """Attribute the time spent in this context to a phase of the request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - start)
+
+
+def timed(phase: str, func: Callable) -> Callable:
+    """Wrap ``func`` so that the time spent in it is attributed to a phase."""
+
+    def wrapper(*args, **kwargs):
+        with track(phase):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return "{" + pairs + "}"
+
+
+class Metrics:
+    """A registry of counters and histograms.
+
+    Parameters
+    ----------
+    directory : str, optional
+        A directory shared by all worker processes, where each of them
+        saves its metrics. It is created if it does not exist.
+        Defaults to ``None``, i.e. only the metrics of the current process
+        are rendered.
+    interval : float, optional
+        The minimum time between two saves of this process's metrics, in
+        seconds. Metrics that changed are also saved this often by a
+        background thread, so metrics of other workers are at most about
+        this old when rendered. Defaults to ``1``.
+    """
+
+    def __init__(self, directory: Optional[str] = None, interval: float = 1):
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.interval = interval
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        self.__lock = threading.Lock()
+        self.__save_lock = threading.Lock()
+        self.__saved = 0.0
+        self.__changed = False
+        self.__saver: Optional[threading.Thread] = None
+        self.__exit_registered = False
+        # The PID the file name was picked for: metrics may be created
+        # before gunicorn forks workers, which need files of their own.
+        self.__pid: Optional[int] = None
+        self.__filename = ""
+
+    # Recording.
+
+    def inc(self, name: str, labels: Labels, value: float = 1):
+        """Increment a counter."""
+        self._start_saver()
+        with self.__lock:
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+            self.__changed = True
+
+    def observe(self, name: str, labels: Labels, value: float, buckets: tuple):
+        """Record a value in a histogram.
+
+        Histograms are stored as the count of each bucket (not cumulative),
+        followed by the sum and the count of values.
+        """
+        self._start_saver()
+        with self.__lock:
+            key = (name, labels)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0.0] * (len(buckets) + 3)
+            index = len(buckets)
+            for position, bound in enumerate(buckets):
+                if value <= bound:
+                    index = position
+                    break
+            histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+            self.__changed = True
+
+    # Per-request phases.
+
+    def start_request(self):
+        """Start tracking the phases of the current thread's request."""
+        _local.phases = {}
+
+    def end_request(self) -> Dict[str, float]:
+        """Stop tracking phases, and return the time spent in each."""
+        phases = getattr(_local, "phases", None) or {}
+        _local.phases = None
+        return phases
+
+    # Multi-process aggregation.
+
+    def _path(self) -> str:
+        pid = os.getpid()
+        if pid != self.__pid:
+            self.__pid = pid
+            self.__filename = f"metrics-{pid}-{uuid.uuid4().hex}.json"
+        return os.path.join(self.directory, self.__filename)
+
+    def save(self, force: bool = False):
+        """Save this process's metrics to the shared directory, if any.
+
+        Unless ``force`` is true, metrics are only saved if they were last
+        saved more than ``interval`` seconds ago. Errors are logged rather
+        than raised, so that requests do not fail because of metrics.
+        """
+        if self.directory is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.__saved < self.interval:
+            return
+        self.__saved = now
+
+        with self.__lock:
+            self.__changed = False
+            snapshot = {
+                "counters": [
+                    [name, labels, value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                "histograms": [
+                    [name, labels, values]
+                    for (name, labels), values in self.histograms.items()
+                ],
+            }
+        # Write atomically, so that other processes never read a partial file.
+        path = self._path()
+        with self.__save_lock:
+            try:
+                with open(path + ".tmp", "w") as file:
+                    json.dump(snapshot, file)
+                os.replace(path + ".tmp", path)
+            except OSError:
+                logger.exception("Failed to save metrics to %s.", path)
+
+    def _start_saver(self):
+        # Started lazily, i.e. after gunicorn forked workers.
+        if self.directory is None:
+            return
+        if self.__saver is None or not self.__saver.is_alive():
+            self.__saver = threading.Thread(
+                target=self._save_periodically,
+                name="metrics-saver",
+                daemon=True,
+            )
+            self.__saver.start()
+            if not self.__exit_registered:
+                atexit.register(self.save, force=True)
+                self.__exit_registered = True
+
+    def _save_periodically(self):
+        while True:
+            time.sleep(self.interval)
+            if self.__changed:
+                self.save(force=True)
+
+    def collect(
+        self,
+    ) -> Tuple[
+        Dict[Tuple[str, Labels], float], Dict[Tuple[str, Labels], List[float]]
+    ]:
+        """Return counters and histograms, summed over all processes."""
+        if self.directory is None:
+            with self.__lock:
+                return (
+                    dict(self.counters),
+                    {
+                        key: list(value)
+                        for key, value in self.histograms.items()
+                    },
+                )
+
+        self.save(force=True)
+        counters: Dict[Tuple[str, Labels], float] = {}
+        histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        for path in glob.glob(os.path.join(self.directory, "metrics-*.json")):
+            try:
+                with open(path) as file:
+                    snapshot = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in snapshot["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                total = histograms.setdefault(key, [0.0] * len(values))
+                for index, value in enumerate(values):
+                    total[index] += value
+        return counters, histograms
+
+    def render(self) -> str:
+        """Render metrics in the Prometheus text format."""
+        counters, histograms = self.collect()
+        lines = []
+
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {name} counter")
+            for (other, labels), value in sorted(counters.items()):
+                if other == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+        for name in sorted({name for name, _ in histograms}):
+            buckets = (
+                SIZE_BUCKETS if name.endswith("_bytes") else DURATION_BUCKETS
+            )
+            lines.append(f"# TYPE {name} histogram")
+            for (other, labels), values in sorted(histograms.items()):
+                if other != name:
+                    continue
+                cumulative = 0.0
+                for bound, count in zip(buckets + ("+Inf",), values):
+                    cumulative += count
+                    bucket_labels = labels + (("le", str(bound)),)
+                    lines.append(
+                        f"{name}_bucket{_format_labels(bucket_labels)} "
+                        f"{cumulative:g}"
+                    )
+                lines.append(
+                    f"{name}_sum{_format_labels(labels)} {values[-2]}"
+                )
+                lines.append(
+                    f"{name}_count{_format_labels(labels)} {values[-1]:g}"
+                )
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Falcon middleware recording request metrics.
+
+    Parameters
+    ----------
+    metrics : Metrics
+    """
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    def process_request(self, req, resp):
+        req.context.metrics_start = time.perf_counter()
+        self.metrics.start_request()
+
+    def process_response(self, req, resp, resource, req_succeeded=True):
+        # Serialize `resp.media` now (Falcon caches the result), so that
+        # the response size is known.
+        with track("json"):
+            data = resp.data
+        duration = time.perf_counter() - req.context.metrics_start
+        phases = self.metrics.end_request()
+
+        labels = (
+            ("method", req.method),
+            ("route", getattr(req, "uri_template", None) or "unmatched"),
+        )
+        status = str(resp.status)[:3]
+        self.metrics.inc(
+            "polyphona_requests_total", labels + (("status", status),)
+        )
+        self.metrics.observe(
+            "polyphona_request_duration_seconds",
+            labels,
+            duration,
+            DURATION_BUCKETS,
+        )
+        for phase, seconds in phases.items():
+            self.metrics.inc(
+                "polyphona_request_phase_seconds_total",
+                labels + (("phase", phase),),
+                seconds,
+            )
+
+        if resp.stream is not None:
+            resp.stream = self._count(resp.stream, labels)
+        else:
+            size = len(data or b"")
+            if resp.body is not None:
+                size += len(resp.body.encode())
+            self._observe_size(labels, size)
+        self.metrics.save()
+
+    def _observe_size(self, labels: Labels, size: int):
+        self.metrics.observe(
+            "polyphona_response_size_bytes", labels, size, SIZE_BUCKETS
+        )
+
+    def _count(self, stream, labels: Labels) -> Iterator[bytes]:
+        # The size of streamed responses is known once they are sent.
+        size = 0
+        try:
+            for chunk in stream:
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._observe_size(labels, size)
+
+
+class MetricsResource:
+    """Resource exposing metrics in the Prometheus text format.
+
+    Parameters
+    ----------
+    metrics : Metrics
+    """
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    def on_get(self, req, resp):
+        """Return metrics."""
+        resp.content_type = "text/plain; version=0.0.4"
+        resp.body = self.metrics.render()
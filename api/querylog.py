@@ -0,0 +1,328 @@
+"""Query timing and slow query log.
+
+When a ``QueryLog`` is given to ``Database``, connections are created with
+cursors that time every statement, and statistics are aggregated per
+statement template, i.e. the SQL text with its whitespace normalized (the
+values are bound parameters, so they are not part of it). Both the time
+spent executing statements and the time spent fetching their rows are
+recorded, as SQLite evaluates queries lazily: most of the work of a
+``SELECT`` may happen while its rows are fetched.
+
+Statements taking longer than a threshold are logged along with their
+``EXPLAIN QUERY PLAN``, which is captured once per template. Plans that
+scan a whole table, rather than searching it with an index, are flagged:
+those statements get slower as the data grows.
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Statements whose plan is captured.
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH")
+
+
+def normalize(sql: str) -> str:
+    """Return the template of a statement.
+
+    Whitespace is collapsed, and lists of placeholders (e.g. ``IN (?,?,?)``)
+    are reduced to a single one, so that they share a template whatever
+    their length.
+
+    Parameters
+    ----------
+    sql : str
+
+    Returns
+    -------
+    template : str
+    """
+    template = " ".join(sql.split())
+    return re.sub(r"\?(\s*,\s*\?)+", "?, ...", template)
+
+
+def is_full_scan(plan: List[str]) -> bool:
+    """Return whether a query plan scans a whole table.
+
+    Scans of a covering index are not reported, nor are scans of
+    subqueries and temporary structures.
+
+    Parameters
+    ----------
+    plan : list of str
+        The ``detail`` column of ``EXPLAIN QUERY PLAN``.
+
+    Returns
+    -------
+    full_scan : bool
+    """
+    return any(
+        detail.startswith("SCAN ")
+        and "INDEX" not in detail
+        and not detail.startswith(("SCAN CONSTANT", "SCAN SUBQUERY"))
+        for detail in plan
+    )
+
+
+class QueryStats:
+    """Statistics of a statement template."""
+
+    __slots__ = (
+        "count",
+        "execute_time",
+        "fetch_time",
+        "max_time",
+        "rows",
+        "slow",
+        "plan",
+    )
+
+    def __init__(self):
+        self.count = 0
+        self.execute_time = 0.0
+        self.fetch_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.plan: Optional[List[str]] = None
+
+
+class QueryLog:
+    """Aggregate statement timings, and log slow statements.
+
+    Parameters
+    ----------
+    threshold : float, optional
+        Statements taking longer than this many seconds (execution and
+        fetching) are logged as warnings. Defaults to ``0.1``.
+    explain : bool, optional
+        Whether to capture the ``EXPLAIN QUERY PLAN`` of slow statements.
+        Defaults to ``True``.
+    """
+
+    def __init__(self, threshold: float = 0.1, explain: bool = True):
+        self.threshold = threshold
+        self.explain = explain
+        self.__stats: Dict[str, QueryStats] = {}
+        self.__lock = threading.Lock()
+
+    def _stats(self, template: str) -> QueryStats:
+        # Must be called with the lock held.
+        stats = self.__stats.get(template)
+        if stats is None:
+            stats = self.__stats[template] = QueryStats()
+        return stats
+
+    def record_execute(self, template: str, seconds: float, rows: int = 0):
+        """Record the execution of a statement."""
+        with self.__lock:
+            stats = self._stats(template)
+            stats.count += 1
+            stats.execute_time += seconds
+            stats.max_time = max(stats.max_time, seconds)
+            stats.rows += rows
+
+    def record_fetch(
+        self, template: str, seconds: float, rows: int, total: float
+    ):
+        """Record the fetching of rows, ``total`` seconds into a statement."""
+        with self.__lock:
+            stats = self._stats(template)
+            stats.fetch_time += seconds
+            stats.max_time = max(stats.max_time, total)
+            stats.rows += rows
+
+    def record_slow(
+        self,
+        conn: sqlite3.Connection,
+        template: str,
+        sql: str,
+        parameters: Any,
+        seconds: float,
+    ):
+        """Log a slow statement, capturing its plan if not known yet."""
+        with self.__lock:
+            stats = self._stats(template)
+            stats.slow += 1
+            plan = stats.plan
+        if plan is None and self.explain:
+            plan = self._explain(conn, sql, parameters)
+            with self.__lock:
+                stats.plan = plan
+        lines = [f"Slow query ({seconds * 1000:.1f} ms): {template}"]
+        if plan:
+            if is_full_scan(plan):
+                lines.append("Full table scan!")
+            lines.extend(f"  {detail}" for detail in plan)
+        logger.warning("\n".join(lines))
+
+    def _explain(
+        self, conn: sqlite3.Connection, sql: str, parameters: Any
+    ) -> List[str]:
+        if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+            return []
+        # A plain cursor, so that the plan itself is not timed.
+        try:
+            rows = sqlite3.Cursor(conn).execute(
+                f"EXPLAIN QUERY PLAN {sql}", parameters
+            )
+            return [detail for *_, detail in rows]
+        except sqlite3.Error:
+            return []
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Return the statistics of each statement template.
+
+        Returns
+        -------
+        summary : list of dict
+            One dict per template, by descending total time, with the keys
+            ``template``, ``count``, ``total_time``, ``execute_time``,
+            ``fetch_time``, ``mean_time`` and ``max_time`` (in seconds),
+            ``rows`` (fetched or modified), ``slow`` (the number of slow
+            executions), ``plan`` (``None`` if the statement was never
+            slow) and ``full_scan``.
+        """
+        with self.__lock:
+            summary = [
+                {
+                    "template": template,
+                    "count": stats.count,
+                    "total_time": stats.execute_time + stats.fetch_time,
+                    "execute_time": stats.execute_time,
+                    "fetch_time": stats.fetch_time,
+                    "mean_time": (
+                        (stats.execute_time + stats.fetch_time) / stats.count
+                        if stats.count
+                        else 0.0
+                    ),
+                    "max_time": stats.max_time,
+                    "rows": stats.rows,
+                    "slow": stats.slow,
+                    "plan": stats.plan,
+                    "full_scan": bool(stats.plan) and is_full_scan(stats.plan),
+                }
+                for template, stats in self.__stats.items()
+            ]
+        summary.sort(key=lambda item: item["total_time"], reverse=True)
+        return summary
+
+    def reset(self):
+        """Forget all statistics."""
+        with self.__lock:
+            self.__stats.clear()
+
+
+class TimedCursor(sqlite3.Cursor):
+    """A cursor recording the time spent in statements to a ``QueryLog``.
+
+    The log is taken from the ``query_log`` attribute of the connection.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        super().__init__(conn)
+        self.__log: QueryLog = conn.query_log
+        self.__statement: Optional[list] = None
+
+    def __start(self, sql: str, parameters: Any, seconds: float):
+        log = self.__log
+        template = normalize(sql)
+        rows = max(self.rowcount, 0)
+        log.record_execute(template, seconds, rows)
+        # Template, SQL, parameters, time so far and whether it was logged.
+        self.__statement = [template, sql, parameters, seconds, False]
+        if seconds > log.threshold:
+            self.__statement[4] = True
+            log.record_slow(
+                self.connection, template, sql, parameters, seconds
+            )
+
+    def __fetched(self, seconds: float, rows: int):
+        statement = self.__statement
+        if statement is None:
+            return
+        template, sql, parameters, total, logged = statement
+        total += seconds
+        statement[3] = total
+        log = self.__log
+        log.record_fetch(template, seconds, rows, total)
+        if not logged and total > log.threshold:
+            statement[4] = True
+            log.record_slow(self.connection, template, sql, parameters, total)
+
+    def execute(self, sql: str, parameters: Any = ()):
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self.__start(sql, parameters, time.perf_counter() - start)
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters: Any):
+        # Parameters may be an iterator, so they cannot be reused for
+        # ``EXPLAIN QUERY PLAN`` unless they are a list.
+        if isinstance(seq_of_parameters, (list, tuple)):
+            first = seq_of_parameters[0] if seq_of_parameters else ()
+        else:
+            first = None
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        seconds = time.perf_counter() - start
+        if first is None:
+            self.__log.record_execute(
+                normalize(sql), seconds, max(self.rowcount, 0)
+            )
+            self.__statement = None
+        else:
+            self.__start(sql, first, seconds)
+        return self
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self.__fetched(time.perf_counter() - start, row is not None)
+        return row
+
+    def fetchmany(self, size: Optional[int] = None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.__fetched(time.perf_counter() - start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self.__fetched(time.perf_counter() - start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self.__fetched(time.perf_counter() - start, 0)
+            raise
+        self.__fetched(time.perf_counter() - start, 1)
+        return row
+
+
+class TimedConnection(sqlite3.Connection):
+    """A connection whose cursors are ``TimedCursor`` instances.
+
+    ``Connection.execute()`` and ``.executemany()`` create their cursor
+    without going through ``.cursor()``, so they are overridden to do so.
+    """
+
+    query_log: QueryLog
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql: str, parameters: Any = ()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Any):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,66 @@
+import datetime
+import hashlib
+
+import falcon
+from falcon import Request, Response
+
+
+def make_etag(*parts) -> str:
+    """Build an entity tag from the given version markers.
+
+    Parameters
+    ----------
+    *parts : any
+        Values that identify the version of a representation, e.g. an ID
+        and a modification date.
+
+    Returns
+    -------
+    etag : str
+        An opaque (unquoted) entity tag.
+    """
+    key = "\n".join(map(str, parts)).encode("utf-8")
+    return hashlib.sha1(key).hexdigest()[:20]
+
+
+def to_http_date(value: str) -> datetime.datetime:
+    """Convert a date stored in the database to a UTC ``datetime``.
+
+    Dates are stored as naive datetimes in the server's local time.
+
+    Parameters
+    ----------
+    value : str
+
+    Returns
+    -------
+    date : datetime.datetime
+        A naive UTC datetime, suitable for Falcon's date headers.
+    """
+    local = datetime.datetime.fromisoformat(value)
+    return local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def not_modified(req: Request, resp: Response, etag: str) -> bool:
+    """Set the ``ETag`` and answer ``304 Not Modified`` if it matches.
+
+    Parameters
+    ----------
+    req : Request
+    resp : Response
+    etag : str
+        The entity tag of the current representation.
+
+    Returns
+    -------
+    not_modified : bool
+        Whether the client's ``If-None-Match`` header matches ``etag``,
+        in which case the response status has been set to ``304`` and
+        the responder should return without a body.
+    """
+    resp.etag = etag
+    if_none_match = req.if_none_match or ()
+    if "*" in if_none_match or etag in if_none_match:
+        resp.status = falcon.HTTP_304
+        return True
+    return False
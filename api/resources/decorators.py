@@ -3,6 +3,8 @@ from typing import Callable
 
 import falcon
 
+from ..metrics import track
+
 
 def authenticated(responder: Callable) -> Callable:
     """Require the client to provide a valid token to access the endpoint.
@@ -23,7 +25,8 @@ def authenticated(responder: Callable) -> Callable:
                 "Authentication credentials were not provided."
             )
 
-        username = self.db.reverse_token(token)
+        with track("auth"):
+            username = self.db.reverse_token(token)
         if username is None:
             raise falcon.HTTPUnauthorized("Invalid token.")
 
@@ -1,3 +1,5 @@
+from typing import List
+
 import falcon
 
 
@@ -22,5 +24,25 @@ def parse_int(value: str) -> int:
     """
     try:
         return int(value)
-    except TypeError:
+    except (TypeError, ValueError):
         raise falcon.HTTPBadRequest(f"Cannot interpret {value} as an integer")
+
+
+def parse_int_list(value: str) -> List[int]:
+    """Parse an inbound comma-separated string into a list of integers.
+
+    Parameters
+    ----------
+    value : str
+        E.g. ``"1,2,3"``.
+
+    Returns
+    -------
+    as_list : list of int
+
+    Raises
+    ------
+    HTTPBadRequest :
+        If an item of ``value`` could not be converted to an integer.
+    """
+    return [parse_int(item) for item in value.split(",") if item]
@@ -1,9 +1,40 @@
 import falcon
 from falcon import Request, Response
+from falcon.util import to_query_str
 
-from ..db import Database
-from .parsers import parse_int
+from ..db import Database, count_notes
+from .parsers import parse_int, parse_int_list
+from .conditional import make_etag, not_modified, to_http_date
 from .decorators import authenticated, require_fields
+from .streaming import NDJSON, json_array, json_lines
+
+# Maximum number of songs per page when listing songs.
+MAX_PAGE_SIZE = 100
+
+# Fields that can be selected when listing songs.
+# All of them but ``tracks`` are available without decoding tracks.
+SUMMARY_FIELDS = (
+    "id",
+    "name",
+    "created",
+    "updated",
+    "track_count",
+    "note_count",
+)
+SONG_FIELDS = SUMMARY_FIELDS + ("tracks",)
+
+# Maximum number of songs fetched or created in a single batch request.
+MAX_BATCH_SIZE = 100
+
+
+def _set_validators(resp: Response, song: dict):
+    resp.etag = make_etag(song["id"], song["updated"])
+    resp.last_modified = to_http_date(song["updated"])
+
+
+def _with_counts(song: dict) -> dict:
+    song["track_count"], song["note_count"] = count_notes(song["tracks"])
+    return song
 
 
 class UserSongsResource:
@@ -22,19 +53,97 @@ class UserSongsResource:
         self.db = db
 
     @authenticated
-    def on_get(self, _, resp: Response, username: str):
+    def on_get(self, req: Request, resp: Response, username: str):
         """Return a user's list of songs.
 
         Requires authentication.
 
+        Songs are ordered by ID. The list can be paginated using the
+        following query parameters:
+
+        - ``limit``: the maximum number of songs to return
+          (at most ``MAX_PAGE_SIZE``). All songs are returned if not given.
+        - ``after``: only return songs whose ID is greater than this one.
+
+        If more songs may be available, the URL of the next page is given
+        in the ``Link`` header (with ``rel="next"``).
+
+        The ``fields`` query parameter selects a comma-separated subset of
+        ``SONG_FIELDS``. Unless ``tracks`` is selected, tracks are not
+        loaded at all, which makes listing songs much cheaper.
+
+        Songs are streamed as a JSON array, or as newline-delimited JSON
+        if the client prefers ``application/x-ndjson``. This keeps memory
+        usage flat regardless of the number of songs.
+
+        The response has an ``ETag`` which changes whenever any of the
+        user's songs change. If it matches the ``If-None-Match`` header,
+        ``304 Not Modified`` is returned without loading any song.
+
         Raises
         ------
         HTTPNotFound :
             If user ``username`` does not exist.
+        HTTPBadRequest :
+            If ``limit``, ``after`` or ``fields`` is invalid.
         """
+        limit = req.get_param_as_int(
+            "limit", min_value=1, max_value=MAX_PAGE_SIZE
+        )
+        after = req.get_param_as_int("after", min_value=0)
+        fields = req.get_param("fields")
+        if fields is not None:
+            fields = fields.split(",")
+
+        unknown = set(fields or ()) - set(SONG_FIELDS)
+        if unknown:
+            raise falcon.HTTPBadRequest(
+                f"Unknown fields: {', '.join(sorted(unknown))}."
+            )
+
         if self.db.user_exists(username):
             raise falcon.HTTPNotFound(title=f"No user named {username}.")
-        resp.media = self.db.get_songs_by_user(username)
+
+        media_type = req.client_prefers((NDJSON, falcon.MEDIA_JSON))
+        version, updated = self.db.get_songs_version_by_user(username)
+        etag = make_etag(username, version, updated, media_type, req.params)
+        resp.vary = ("Accept",)
+        if updated:
+            resp.last_modified = to_http_date(updated)
+        if not_modified(req, resp, etag):
+            return
+
+        if fields is not None and "tracks" not in fields:
+            songs = self.db.iter_song_summaries_by_user(
+                username, limit=limit, after=after
+            )
+        else:
+            songs = self.db.iter_songs_by_user(
+                username, limit=limit, after=after
+            )
+            if fields is not None:
+                songs = map(_with_counts, songs)
+
+        if limit is not None:
+            # Pages are small, so they can be held in memory in order to
+            # find the cursor of the next page. The cursor is taken before
+            # projecting fields, which may leave out the ID.
+            songs = list(songs)
+            if len(songs) == limit:
+                params = {**req.params, "after": songs[-1]["id"]}
+                resp.add_link(req.path + to_query_str(params), "next")
+
+        if fields is not None:
+            songs = (
+                {field: song[field] for field in fields} for song in songs
+            )
+
+        if media_type == NDJSON:
+            resp.content_type = NDJSON
+            resp.stream = json_lines(songs)
+        else:
+            resp.content_type = falcon.MEDIA_JSON
+            resp.stream = json_array(songs)
 
 
 class SongResource:
@@ -49,9 +158,50 @@ class SongResource:
         self.db: Database = db
 
     @authenticated
-    def on_get(self, _, resp: Response, pk: str):
-        """Return a song by ID."""
-        resp.media = self.db.get_song_by_id(id=parse_int(pk))
+    def on_get(self, req: Request, resp: Response, pk: str = None):
+        """Return a song by ID, or several songs at once.
+
+        Requires authentication.
+
+        When no ID is given in the path, the IDs of the songs to return
+        are given in the ``ids`` query parameter, e.g. ``?ids=1,2,3``
+        (at most ``MAX_BATCH_SIZE``). Songs are returned as a list, in the
+        order of ``ids``. Songs that do not exist are left out.
+
+        The response has an ``ETag`` and a ``Last-Modified`` header. If the
+        ``ETag`` matches the ``If-None-Match`` header, ``304 Not Modified``
+        is returned without a body, and without loading the song's tracks.
+        Otherwise, both headers are read along with the song, so that they
+        always match it.
+
+        The song's JSON is passed through from the database (see
+        ``Database.get_song_json()``) so that tracks are not decoded only
+        to be encoded again.
+        """
+        # NOTE: `/songs/` may be routed here with an empty `pk`.
+        if not pk:
+            ids = parse_int_list(req.get_param("ids", required=True))
+            if len(ids) > MAX_BATCH_SIZE:
+                raise falcon.HTTPBadRequest(
+                    f"At most {MAX_BATCH_SIZE} songs can be fetched at once."
+                )
+            resp.media = self.db.get_songs_by_ids(ids)
+            return
+
+        id = parse_int(pk)
+        if req.if_none_match:
+            updated = self.db.get_song_updated(id)
+            if not_modified(req, resp, make_etag(id, updated)):
+                resp.last_modified = to_http_date(updated)
+                return
+
+        # The song may have changed since it was checked above.
+        data, updated = self.db.get_song_json_and_updated(id)
+        resp.etag = make_etag(id, updated)
+        resp.last_modified = to_http_date(updated)
+
+        resp.content_type = falcon.MEDIA_JSON
+        resp.data = data
 
     @authenticated
     @require_fields("name", "tracks")
@@ -59,15 +209,39 @@ class SongResource:
         """Modify a song.
 
         Requires authentication.
+
+        Raises
+        ------
+        HTTPBadRequest :
+            If ``name`` is not a string.
         """
-        id: int = parse_int(pk)
-        self.db.update_song(
-            id=id,
+        if not isinstance(req.media["name"], str):
+            raise falcon.HTTPBadRequest("'name' must be a string.")
+        song = self.db.update_song(
+            id=parse_int(pk),
             name=req.media["name"],
             tracks=req.media["tracks"],
             username=req.username,
         )
-        resp.media = self.db.get_song_by_id(id=id)
+        _set_validators(resp, song)
+        resp.media = song
+
+    @authenticated
+    def on_patch(self, req: Request, resp: Response, pk: str):
+        """Partially modify a song.
+
+        Requires authentication.
+
+        The payload is a JSON Patch (RFC 6902), i.e. a list of operations
+        applied to the song's ``name`` and ``tracks``. This allows clients
+        to send only what changed, e.g. a single moved note.
+        """
+        id: int = parse_int(pk)
+        song = self.db.patch_song(
+            id=id, patch=req.media, username=req.username
+        )
+        _set_validators(resp, song)
+        resp.media = song
 
     @authenticated
     @require_fields("name", "tracks")
@@ -76,11 +250,14 @@ class SongResource:
         
         Requires authentication.
         """
-        pk = self.db.create_song(
-            name=req.media["name"], tracks=req.media["tracks"]
-        )
-        self.db.create_song_user_link(pk, req.username)
-        resp.media = self.db.get_song_by_id(id=pk)
+        song = {"name": req.media["name"], "tracks": req.media["tracks"]}
+        with self.db.transaction():
+            # The owner is given along with the song, so that a sharded
+            # database can pick the owner's shard.
+            pk, = self.db.create_songs([song], username=req.username)
+            song = self.db.get_song_by_id(id=pk)
+        _set_validators(resp, song)
+        resp.media = song
         resp.status = falcon.HTTP_201
 
     @authenticated
@@ -91,3 +268,48 @@ class SongResource:
         """
         self.db.delete_song(id=parse_int(pk), username=req.username)
         resp.status = falcon.HTTP_204
+
+
+class SongBatchResource:
+    """Resource to create several songs at once.
+
+    Parameters
+    ----------
+    db : Database
+    """
+
+    def __init__(self, db: Database):
+        self.db: Database = db
+
+    @authenticated
+    @require_fields("songs")
+    def on_post(self, req: Request, resp: Response):
+        """Create several songs.
+
+        Requires authentication.
+
+        The payload is ``{"songs": [...]}``, where each song has a ``name``
+        and ``tracks`` (at most ``MAX_BATCH_SIZE`` songs). Songs are created
+        within a single transaction: either all of them or none are created.
+        The created songs are returned in the same order.
+        """
+        songs = req.media["songs"]
+        if not isinstance(songs, list):
+            raise falcon.HTTPBadRequest("'songs' must be a list.")
+        if len(songs) > MAX_BATCH_SIZE:
+            raise falcon.HTTPBadRequest(
+                f"At most {MAX_BATCH_SIZE} songs can be created at once."
+            )
+        for song in songs:
+            if not isinstance(song, dict):
+                raise falcon.HTTPBadRequest("Each song must be an object.")
+            for field in ("name", "tracks"):
+                if field not in song:
+                    raise falcon.HTTPBadRequest(
+                        f"'{field}': this field is required.."
+                    )
+
+        with self.db.transaction():
+            ids = self.db.create_songs(songs, username=req.username)
+            resp.media = self.db.get_songs_by_ids(ids)
+        resp.status = falcon.HTTP_201
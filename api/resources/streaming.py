@@ -0,0 +1,65 @@
+from typing import Iterable, Iterator
+
+from .. import codec
+
+# Media type of newline-delimited JSON.
+NDJSON = "application/x-ndjson"
+
+# Encoded items are buffered until they reach this size (in bytes),
+# so that small items don't result in many tiny writes.
+CHUNK_SIZE = 64 * 1024
+
+
+def _chunked(parts: Iterable[bytes]) -> Iterator[bytes]:
+    buffer = bytearray()
+    for part in parts:
+        buffer += part
+        if len(buffer) >= CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def json_array(items: Iterable) -> Iterator[bytes]:
+    """Encode items as a JSON array, incrementally.
+
+    The output is the same as encoding the list of items at once with
+    ``api.codec``, but only one item needs to be held in memory at a time.
+
+    This is meant to be used as a Falcon ``resp.stream``.
+
+    Parameters
+    ----------
+    items : iterable
+        JSON-serializable items.
+
+    Returns
+    -------
+    chunks : iterator of bytes
+    """
+
+    def parts() -> Iterator[bytes]:
+        yield b"["
+        for index, item in enumerate(items):
+            if index:
+                yield b","
+            yield codec.dumps(item)
+        yield b"]"
+
+    return _chunked(parts())
+
+
+def json_lines(items: Iterable) -> Iterator[bytes]:
+    """Encode items as newline-delimited JSON (one item per line).
+
+    Parameters
+    ----------
+    items : iterable
+        JSON-serializable items.
+
+    Returns
+    -------
+    chunks : iterator of bytes
+    """
+    return _chunked(codec.dumps(item) + b"\n" for item in items)
@@ -1,5 +1,3 @@
-from uuid import uuid4
-
 import falcon
 from falcon import Request, Response
 
@@ -18,6 +16,9 @@ class TokenResource:
         """Exchange user credentials for a new token.
         
         The payload must contain the ``username`` and ``password`` fields.
+
+        Depending on the database configuration, the token is either an
+        opaque token or a signed token (see ``Database.create_token()``).
         
         Raises
         ------
@@ -28,13 +29,16 @@ class TokenResource:
         username = req.media["username"]
         password = req.media["password"]
 
-        if not self.db.check_user(username, password):
-            raise falcon.HTTPUnauthorized("Invalid credentials.")
+        # Checking credentials only reads, so it does not take the write
+        # lock. Opaque tokens are then saved on their own.
+        with self.db.transaction(immediate=False):
+            if not self.db.check_user(username, password):
+                raise falcon.HTTPUnauthorized("Invalid credentials.")
+            user = self.db.get_user(username)
 
-        token = str(uuid4())
-        self.db.save_token(username, token)
+        token = self.db.create_token(username)
 
-        resp.media = {"token": token, "user": self.db.get_user(username)}
+        resp.media = {"token": token, "user": user}
 
     def on_delete(self, _, resp: Response, token: str):
         """Delete a token."""
@@ -35,9 +35,12 @@ class UserResource:
         """
         username = req.media["username"]
 
-        if not self.db.user_exists(username):
-            raise falcon.HTTPBadRequest(f"User {username} already exists.")
+        with self.db.transaction():
+            if not self.db.user_exists(username):
+                raise falcon.HTTPBadRequest(
+                    f"User {username} already exists."
+                )
 
-        self.db.create_user(**req.media)
+            self.db.create_user(**req.media)
 
         resp.status = falcon.HTTP_201
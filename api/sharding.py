@@ -0,0 +1,661 @@
+"""Horizontal sharding of the database by username.
+
+Users are hashed into ``NUM_BUCKETS`` buckets, and buckets are assigned to
+shards (separate SQLite files) by consistent hashing, see
+``assign_buckets()``. A user, their songs and their tokens all live on the
+shard of the user's bucket, so that writes of users on different shards
+never wait for each other.
+
+Song IDs are globally unique and routable: the low ``BUCKET_BITS`` bits of
+a song ID are the bucket of its owner, and the high bits a sequence number
+that is unique within the bucket. Opaque tokens start with the bucket of
+their user (in hexadecimal), and signed tokens carry the username.
+
+The number of shards is changed with ``rebalance()``, which moves buckets
+between shards. Since song IDs refer to buckets rather than shards, they
+do not change when songs are moved.
+"""
+
+import bisect
+import collections
+import datetime
+import hashlib
+import threading
+import uuid
+from contextlib import ExitStack, contextmanager, suppress
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .db import Database, DoesNotExist
+from .signing import is_signed
+
+BUCKET_BITS = 10
+NUM_BUCKETS = 2 ** BUCKET_BITS
+# Points of each shard on the hash ring. More points spread buckets more
+# evenly across shards.
+REPLICAS = 256
+
+
+def _hash(key: str) -> int:
+    # Stable across processes, unlike `hash()`.
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+def user_bucket(username: str) -> int:
+    """Return the bucket of a user.
+
+    Parameters
+    ----------
+    username : str
+
+    Returns
+    -------
+    bucket : int
+    """
+    return _hash(username) % NUM_BUCKETS
+
+
+def song_bucket(song_id: int) -> int:
+    """Return the bucket of a song, i.e. the bucket of its owner.
+
+    Parameters
+    ----------
+    song_id : int
+
+    Returns
+    -------
+    bucket : int
+    """
+    return song_id % NUM_BUCKETS
+
+
+def make_song_id(sequence: int, bucket: int) -> int:
+    """Return the ID of a song from its sequence number and bucket."""
+    return (sequence << BUCKET_BITS) | bucket
+
+
+def token_bucket(token: str) -> Optional[int]:
+    """Return the bucket of an opaque token, if it was issued by a shard.
+
+    Parameters
+    ----------
+    token : str
+
+    Returns
+    -------
+    bucket : int or None
+        ``None`` for tokens issued without sharding.
+    """
+    prefix, separator, _ = token.partition("-")
+    if separator and len(prefix) == 3:
+        with suppress(ValueError):
+            return int(prefix, 16) % NUM_BUCKETS
+    return None
+
+
+def assign_buckets(shard_count: int, replicas: int = REPLICAS) -> List[int]:
+    """Assign buckets to shards by consistent hashing.
+
+    Each shard has ``replicas`` points on a hash ring, and each bucket
+    belongs to the shard of the first point following the bucket on the
+    ring. When a shard is added, buckets only move to the new shard, about
+    one in ``shard_count + 1`` of them.
+
+    Parameters
+    ----------
+    shard_count : int
+    replicas : int, optional
+        Defaults to ``REPLICAS``.
+
+    Returns
+    -------
+    shards : list of int
+        The index of the shard of each bucket.
+    """
+    ring = sorted(
+        (_hash(f"shard-{index}-{replica}"), index)
+        for index in range(shard_count)
+        for replica in range(replicas)
+    )
+    points = [point for point, _ in ring]
+    return [
+        ring[bisect.bisect(points, _hash(f"bucket-{bucket}")) % len(ring)][1]
+        for bucket in range(NUM_BUCKETS)
+    ]
+
+
+def next_song_sequence(db: Database) -> int:
+    """Return a song sequence number greater than those of all songs.
+
+    This is cheap, as SQLite reads the largest ID from the end of the
+    table's B-tree.
+
+    Parameters
+    ----------
+    db : Database
+
+    Returns
+    -------
+    sequence : int
+    """
+    with db:
+        last_id, = db.cursor.execute(
+            "SELECT MAX(SongID) FROM songs"
+        ).fetchone()
+    return ((last_id or 0) >> BUCKET_BITS) + 1
+
+
+class ShardedDatabase:
+    """A database split into several SQLite files, by username.
+
+    This exposes the methods of ``Database`` that are used by the API,
+    each routed to the shard that holds the data, so that it can be used in
+    place of a ``Database``. Songs are created with ``.create_songs()``,
+    which knows their owner (and therefore their shard).
+
+    Tokens are looked up on the shard of their user. Opaque tokens issued
+    before sharding do not carry a bucket and are looked up on every shard.
+
+    Parameters
+    ----------
+    paths : list of str
+        The paths to the SQLite files of the shards. Their order matters:
+        it determines which buckets each shard holds. Use ``rebalance()``
+        to change it.
+    **options : any
+        Options of each shard's ``Database``, e.g. ``pool_size``.
+    """
+
+    def __init__(self, paths: Sequence[str], **options):
+        if not paths:
+            raise ValueError("At least one shard is required.")
+        self.paths = list(paths)
+        self.shards = [Database(path, **options) for path in self.paths]
+        self.buckets = assign_buckets(len(self.shards))
+        self.token_signer = self.shards[0].token_signer
+        self.query_log = self.shards[0].query_log
+        self.__local = threading.local()
+
+    @property
+    def tracks_format(self) -> str:
+        return self.shards[0].tracks_format
+
+    @tracks_format.setter
+    def tracks_format(self, value: str):
+        for shard in self.shards:
+            shard.tracks_format = value
+
+    @property
+    def compression_level(self) -> int:
+        return self.shards[0].compression_level
+
+    @compression_level.setter
+    def compression_level(self, value: int):
+        for shard in self.shards:
+            shard.compression_level = value
+
+    # Routing.
+
+    def _shard(self, index: int) -> Database:
+        shard = self.shards[index]
+        # Within a transaction, shards join it when they are first used.
+        stack = getattr(self.__local, "stack", None)
+        if stack is not None and index not in self.__local.joined:
+            self.__local.joined.add(index)
+            stack.enter_context(shard.transaction(self.__local.immediate))
+        return shard
+
+    def shard_for_user(self, username: str) -> Database:
+        """Return the shard holding a user and their songs and tokens."""
+        return self._shard(self.buckets[user_bucket(username)])
+
+    def shard_for_song(self, id: int) -> Database:
+        """Return the shard holding a song."""
+        return self._shard(self.buckets[song_bucket(id)])
+
+    def _shards_for_token(self, token: str) -> List[Database]:
+        if is_signed(token):
+            claims = self.token_signer and self.token_signer.verify(token)
+            return [self.shard_for_user(claims.username)] if claims else []
+        bucket = token_bucket(token)
+        if bucket is None:
+            return [self._shard(index) for index in range(len(self.shards))]
+        return [self._shard(self.buckets[bucket])]
+
+    @contextmanager
+    def transaction(
+        self, immediate: bool = True
+    ) -> Iterator["ShardedDatabase"]:
+        """Group several method calls into a single transaction per shard.
+
+        See ``Database.transaction()``. Each shard used within the
+        transaction starts its own transaction when it is first used, and
+        they are all committed (or rolled back) when it ends. The API only
+        uses the shard of a single user per transaction; transactions
+        spanning several shards are not atomic.
+
+        Parameters
+        ----------
+        immediate : bool, optional
+            Whether shards take their write lock when they join the
+            transaction. Defaults to ``True``.
+
+        Yields
+        ------
+        db : ShardedDatabase
+        """
+        if getattr(self.__local, "stack", None) is not None:
+            yield self
+            return
+
+        with ExitStack() as stack:
+            self.__local.stack = stack
+            self.__local.joined = set()
+            self.__local.immediate = immediate
+            try:
+                yield self
+            finally:
+                self.__local.stack = None
+
+    # Administration.
+
+    def generate_schema(self):
+        """Generate the schema of every shard."""
+        for shard in self.shards:
+            shard.generate_schema()
+
+    def migrate(self) -> int:
+        """Apply pending schema migrations to every shard."""
+        return min(shard.migrate() for shard in self.shards)
+
+    @property
+    def schema_version(self) -> int:
+        return min(shard.schema_version for shard in self.shards)
+
+    def flush(self) -> int:
+        """Write queued song updates of every shard."""
+        return sum(shard.flush() for shard in self.shards)
+
+    def repack_songs(self, batch_size: int = 100) -> int:
+        """Re-encode stored tracks of every shard."""
+        return sum(shard.repack_songs(batch_size) for shard in self.shards)
+
+    def sweep_expired_tokens(
+        self, batch_size: int = 500, pause: float = 0
+    ) -> Tuple[int, float]:
+        """Delete expired tokens from every shard."""
+        count, elapsed = 0, 0.0
+        for shard in self.shards:
+            shard_count, shard_elapsed = shard.sweep_expired_tokens(
+                batch_size, pause
+            )
+            count += shard_count
+            elapsed += shard_elapsed
+        return count, elapsed
+
+    def close(self):
+        """Close every shard."""
+        for shard in self.shards:
+            shard.close()
+
+    def remove(self):
+        """Close every shard and delete their files."""
+        for shard in self.shards:
+            shard.remove()
+
+    # Songs.
+
+    def get_song_by_id(self, id: int) -> dict:
+        return self.shard_for_song(id).get_song_by_id(id)
+
+    def get_song_json(self, id: int) -> bytes:
+        return self.shard_for_song(id).get_song_json(id)
+
+    def get_song_json_and_updated(self, id: int) -> Tuple[bytes, str]:
+        return self.shard_for_song(id).get_song_json_and_updated(id)
+
+    def get_song_updated(self, id: int) -> str:
+        return self.shard_for_song(id).get_song_updated(id)
+
+    def get_songs_by_ids(self, ids: List[int]) -> List[dict]:
+        """Retrieve several songs at once, with one query per shard."""
+        by_shard: Dict[int, List[int]] = collections.defaultdict(list)
+        for id in dict.fromkeys(ids):
+            by_shard[self.buckets[song_bucket(id)]].append(id)
+        songs = {}
+        for index, shard_ids in by_shard.items():
+            for song in self._shard(index).get_songs_by_ids(shard_ids):
+                songs[song["id"]] = song
+        return [songs[id] for id in dict.fromkeys(ids) if id in songs]
+
+    def get_songs_version_by_user(self, username: str) -> Tuple[int, str]:
+        return self.shard_for_user(username).get_songs_version_by_user(
+            username
+        )
+
+    def iter_songs_by_user(
+        self,
+        username: str,
+        limit: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> Iterator[dict]:
+        return self.shard_for_user(username).iter_songs_by_user(
+            username, limit, after
+        )
+
+    def get_songs_by_user(
+        self,
+        username: str,
+        limit: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> List[dict]:
+        return list(self.iter_songs_by_user(username, limit, after))
+
+    def iter_song_summaries_by_user(
+        self,
+        username: str,
+        limit: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> Iterator[dict]:
+        return self.shard_for_user(username).iter_song_summaries_by_user(
+            username, limit, after
+        )
+
+    def get_song_summaries_by_user(
+        self,
+        username: str,
+        limit: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> List[dict]:
+        return list(self.iter_song_summaries_by_user(username, limit, after))
+
+    def create_songs(self, songs: List[dict], username: str) -> List[int]:
+        """Save several new songs for a user at once.
+
+        See ``Database.create_songs()``. Songs are saved on the user's
+        shard, with IDs made of the user's bucket and sequence numbers
+        following those of all songs of the shard.
+        """
+        bucket = user_bucket(username)
+        shard = self.shard_for_user(username)
+        with shard.transaction():
+            sequence = next_song_sequence(shard)
+            song_ids = [
+                shard.create_song(
+                    song["name"],
+                    song["tracks"],
+                    id=make_song_id(sequence + index, bucket),
+                )
+                for index, song in enumerate(songs)
+            ]
+            for song_id in song_ids:
+                shard.create_song_user_link(song_id, username)
+            return song_ids
+
+    def update_song(
+        self, id: int, name: str, tracks: List[dict], username: str
+    ) -> dict:
+        return self.shard_for_song(id).update_song(id, name, tracks, username)
+
+    def patch_song(self, id: int, patch: List[dict], username: str) -> dict:
+        return self.shard_for_song(id).patch_song(id, patch, username)
+
+    def delete_song(self, id: int, username: str):
+        self.shard_for_song(id).delete_song(id, username)
+
+    # Users.
+
+    def user_exists(self, username: str) -> bool:
+        return self.shard_for_user(username).user_exists(username)
+
+    def create_user(
+        self, username: str, first_name: str, last_name: str, password: str
+    ):
+        self.shard_for_user(username).create_user(
+            username, first_name, last_name, password
+        )
+
+    def get_user(self, username: str) -> dict:
+        return self.shard_for_user(username).get_user(username)
+
+    def check_user(self, username: str, password: str) -> bool:
+        return self.shard_for_user(username).check_user(username, password)
+
+    # Tokens.
+
+    def create_token(self, username: str) -> str:
+        """Issue a new token for a user.
+
+        Opaque tokens start with the user's bucket, so that they can be
+        looked up on the user's shard.
+        """
+        if self.token_signer is not None:
+            return self.token_signer.sign(username)
+        token = f"{user_bucket(username):03x}-{uuid.uuid4()}"
+        self.save_token(username, token)
+        return token
+
+    def save_token(self, username: str, token: str):
+        self.shard_for_user(username).save_token(username, token)
+
+    def reverse_token(self, token: str) -> Optional[str]:
+        for shard in self._shards_for_token(token):
+            username = shard.reverse_token(token)
+            if username is not None:
+                return username
+        return None
+
+    def delete_token(self, token: str):
+        for shard in self._shards_for_token(token):
+            with suppress(DoesNotExist):
+                shard.delete_token(token)
+                return
+        raise DoesNotExist("Token", token=token)
+
+
+def _renumber_songs(
+    source: Database, target: Database, username: str, bucket: int
+) -> int:
+    # Give songs whose ID does not carry their owner's bucket (i.e. songs
+    # created without sharding) a new ID, in place. Sequence numbers follow
+    # those of both shards, so that the new IDs are free on both.
+    with source.transaction():
+        source.cursor.execute(
+            "SELECT SongID FROM song_user_links WHERE UserName = ?",
+            (username,),
+        )
+        ids = [id for id, in source.cursor if song_bucket(id) != bucket]
+        if not ids:
+            return 0
+        sequence = max(next_song_sequence(source), next_song_sequence(target))
+        for index, id in enumerate(ids):
+            new_id = make_song_id(sequence + index, bucket)
+            for table in ("songs", "song_user_links"):
+                source.cursor.execute(
+                    f"UPDATE {table} SET SongID = ? WHERE SongID = ?",
+                    (new_id, id),
+                )
+        return len(ids)
+
+
+def _move_user(source: Database, target: Database, username: str) -> int:
+    # Copy the user and their songs and tokens (keeping song IDs), then
+    # delete them from the source. Copies replace existing rows, so that
+    # an interrupted move can be resumed.
+    with source:
+        source.cursor.execute(
+            """
+            SELECT UserName, FirstName, LastName, Password
+            FROM users WHERE UserName = ?
+            """,
+            (username,),
+        )
+        user = source.cursor.fetchone()
+        source.cursor.execute(
+            """
+            SELECT songs.SongID, SongName, Created, Updated, TracksJson,
+                TrackCount, NoteCount
+            FROM song_user_links, songs
+            ON songs.SongID = song_user_links.SongID
+            WHERE UserName = ?
+            """,
+            (username,),
+        )
+        songs = source.cursor.fetchall()
+        source.cursor.execute(
+            """
+            SELECT Token, UserName, RefreshDate
+            FROM tokens WHERE UserName = ?
+            """,
+            (username,),
+        )
+        tokens = source.cursor.fetchall()
+        source.cursor.execute(
+            """
+            SELECT UserName, Version, Updated
+            FROM user_versions WHERE UserName = ?
+            """,
+            (username,),
+        )
+        version = source.cursor.fetchone()
+
+    with target.transaction():
+        target.cursor.execute(
+            "INSERT OR REPLACE INTO users VALUES (?,?,?,?)", user
+        )
+        target.cursor.executemany(
+            """
+            INSERT OR REPLACE INTO songs (
+                SongID, SongName, Created, Updated, TracksJson,
+                TrackCount, NoteCount
+            )
+            VALUES (?,?,?,?,?,?,?)
+            """,
+            songs,
+        )
+        target.cursor.executemany(
+            """
+            INSERT INTO song_user_links (SongID, UserName)
+            SELECT ?1, ?2 WHERE NOT EXISTS (
+                SELECT 1 FROM song_user_links
+                WHERE SongID = ?1 AND UserName = ?2
+            )
+            """,
+            [(song[0], username) for song in songs],
+        )
+        target.cursor.executemany(
+            "INSERT OR REPLACE INTO tokens VALUES (?,?,?)", tokens
+        )
+        if version is not None:
+            # Links created above bumped the version on the target: keep it
+            # above any version of the user's songs served by the source,
+            # so that ETags of listings are never reused.
+            target.cursor.execute(
+                """
+                INSERT INTO user_versions (UserName, Version, Updated)
+                VALUES (?,?,?)
+                ON CONFLICT (UserName) DO UPDATE SET
+                    Version = MAX(Version, excluded.Version) + 1,
+                    Updated = excluded.Updated
+                """,
+                version,
+            )
+
+    with source.transaction():
+        source.cursor.executemany(
+            "DELETE FROM songs WHERE SongID = ?",
+            [(song[0],) for song in songs],
+        )
+        source.cursor.execute(
+            "DELETE FROM song_user_links WHERE UserName = ?", (username,)
+        )
+        source.cursor.execute(
+            "DELETE FROM user_versions WHERE UserName = ?", (username,)
+        )
+        source.cursor.execute(
+            "DELETE FROM tokens WHERE UserName = ?", (username,)
+        )
+        source.cursor.execute(
+            "DELETE FROM users WHERE UserName = ?", (username,)
+        )
+    return len(songs)
+
+
+def rebalance(
+    old_paths: Sequence[str], new_paths: Sequence[str], **options
+) -> Dict[str, int]:
+    """Move users, songs and tokens after changing the list of shards.
+
+    Each user is moved, along with their songs and tokens, to the shard of
+    their bucket among ``new_paths``. With consistent hashing, adding a
+    shard at the end of the list only moves about ``1 / len(new_paths)`` of
+    the users. Paths may appear in both lists; shards that are only in
+    ``old_paths`` are emptied, and can be deleted afterwards.
+
+    A database created without sharding can be split by passing it as the
+    only old shard. Its songs then get new IDs, since their IDs do not
+    carry their owner's bucket; other songs keep their ID.
+
+    Revocations of signed tokens are copied to every new shard, as they are
+    not tied to a user.
+
+    The server must be stopped while rebalancing. If rebalancing is
+    interrupted, it can safely be run again.
+
+    Parameters
+    ----------
+    old_paths : list of str
+        The paths to the shards' SQLite files, in their current order.
+    new_paths : list of str
+        The paths to the shards' SQLite files, in their new order.
+    **options : any
+        Options of each shard's ``Database``, e.g. ``pragmas``.
+
+    Returns
+    -------
+    counts : dict
+        The number of ``users`` and ``songs`` moved, and the number of
+        songs ``renumbered``.
+    """
+    paths = list(dict.fromkeys([*old_paths, *new_paths]))
+    databases = {path: Database(path, **options) for path in paths}
+    buckets = assign_buckets(len(new_paths))
+    counts = {"users": 0, "songs": 0, "renumbered": 0}
+    try:
+        for db in databases.values():
+            db.generate_schema()
+
+        now = datetime.datetime.now()
+        revoked = []
+        for path in dict.fromkeys(old_paths):
+            with databases[path] as db:
+                db.cursor.execute(
+                    "SELECT TokenID, Expires FROM revoked_tokens "
+                    "WHERE Expires > ?",
+                    (now,),
+                )
+                revoked.extend(db.cursor.fetchall())
+        for path in dict.fromkeys(new_paths):
+            with databases[path].transaction() as db:
+                db.cursor.executemany(
+                    "INSERT OR IGNORE INTO revoked_tokens VALUES (?,?)",
+                    revoked,
+                )
+
+        for path in dict.fromkeys(old_paths):
+            source = databases[path]
+            with source:
+                source.cursor.execute("SELECT UserName FROM users")
+                usernames = [username for username, in source.cursor]
+            for username in usernames:
+                bucket = user_bucket(username)
+                target = databases[new_paths[buckets[bucket]]]
+                counts["renumbered"] += _renumber_songs(
+                    source, target, username, bucket
+                )
+                if target is not source:
+                    counts["songs"] += _move_user(source, target, username)
+                    counts["users"] += 1
+    finally:
+        for db in databases.values():
+            db.close()
+    return counts
@@ -0,0 +1,309 @@
+"""Storage formats for song tracks.
+
+Tracks are stored in the ``songs.TracksJson`` column in one of the
+following formats:
+
+- ``json``: JSON encoded by ``api.codec``, stored as a ``blob``. Since it
+  is exactly what the API would send, it can be passed through to clients
+  without being decoded (see ``tracks_json()``).
+- ``columnar``: a compact binary format, stored as a ``blob``.
+
+Values stored as ``blob`` start with a header byte that identifies their
+format, so that ``decode_tracks()`` can read any of them. Either format may
+also be compressed with zlib: the header byte then indicates compression,
+and the compressed data is itself a tagged value.
+
+Songs saved by earlier versions are stored as JSON ``text``, which is
+still readable.
+
+Columnar format
+---------------
+
+Notes take most of the space of a song, and as JSON every note repeats
+every key name. In the columnar format, the notes of a track are stored
+column by column: each column holds the values of one key for all notes,
+packed according to their type:
+
+- Integer columns are packed as fixed-width little-endian integers, using
+  the smallest width (1, 2, 4 or 8 bytes) that fits all values.
+- Float columns are packed as 64-bit floats.
+- String columns are dictionary-encoded: distinct values are stored once
+  (as JSON) followed by packed integer indices.
+- Other columns (e.g. mixed types) are stored as a JSON list.
+
+A track's notes can only be stored as columns if all notes are objects
+with the same keys, in the same order. Other tracks are stored as-is.
+
+Layout::
+
+    header (1 byte) | skeleton length (4 bytes) | skeleton | columns
+
+The skeleton is a JSON object with the tracks (without the notes stored as
+columns) and the layout of each track's columns.
+"""
+
+import struct
+import zlib
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from . import codec
+
+FORMAT_JSON = "json"
+FORMAT_COLUMNAR = "columnar"
+FORMATS = (FORMAT_JSON, FORMAT_COLUMNAR)
+
+# Header bytes of values stored as blobs.
+HEADER_COLUMNAR = 0x01
+HEADER_JSON = 0x02
+HEADER_ZLIB = 0x03
+
+# Packed integer types, from the narrowest to the widest.
+_INT_TYPES = (("b", -(2 ** 7)), ("h", -(2 ** 15)), ("i", -(2 ** 31)))
+_INT64_MIN, _INT64_MAX = -(2 ** 63), 2 ** 63 - 1
+
+_LENGTH = struct.Struct("<I")
+
+
+def _int_type(values: List[int]) -> str:
+    low, high = min(values), max(values)
+    for code, minimum in _INT_TYPES:
+        if low >= minimum and high < -minimum:
+            return code
+    return "q"
+
+
+def _column_type(values: List[Any]) -> str:
+    # NOTE: `bool` is a subclass of `int`, so exact type checks are needed.
+    types = {type(value) for value in values}
+    if types == {int}:
+        if min(values) >= _INT64_MIN and max(values) <= _INT64_MAX:
+            return _int_type(values)
+    elif types == {float}:
+        return "d"
+    elif types == {str}:
+        return "s"
+    return "j"
+
+
+def _pack(code: str, values: List[Any]) -> bytes:
+    return struct.pack(f"<{len(values)}{code}", *values)
+
+
+def _encode_column(values: List[Any], out: bytearray) -> str:
+    code = _column_type(values)
+
+    if code == "s":
+        distinct = list(dict.fromkeys(values))
+        index = {value: position for position, value in enumerate(distinct)}
+        indices = [index[value] for value in values]
+        index_code = _int_type(indices)
+        table = codec.dumps(distinct)
+        out += _LENGTH.pack(len(table)) + table
+        out += _pack(index_code, indices)
+        return code + index_code
+
+    if code == "j":
+        data = codec.dumps(values)
+        out += _LENGTH.pack(len(data)) + data
+        return code
+
+    out += _pack(code, values)
+    return code
+
+
+def _decode_column(
+    code: str, count: int, data: bytes, offset: int
+) -> Tuple[List[Any], int]:
+    if code[0] in "sj":
+        length, = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        decoded = codec.loads(data[offset : offset + length])
+        offset += length
+        if code[0] == "j":
+            return decoded, offset
+        index_code = code[1]
+        indices = struct.unpack_from(f"<{count}{index_code}", data, offset)
+        offset += count * struct.calcsize(index_code)
+        return [decoded[index] for index in indices], offset
+
+    values = struct.unpack_from(f"<{count}{code}", data, offset)
+    return list(values), offset + count * struct.calcsize(code)
+
+
+def _note_keys(notes: Any) -> Optional[Tuple[str, ...]]:
+    # Return the keys shared by all notes, if notes can be stored as columns.
+    if not isinstance(notes, list) or not notes:
+        return None
+    if not all(isinstance(note, dict) for note in notes):
+        return None
+    keys = tuple(notes[0])
+    if not keys or any(tuple(note) != keys for note in notes):
+        return None
+    return keys
+
+
+def encode_columnar(tracks: List[Any]) -> bytes:
+    """Encode tracks using the columnar format.
+
+    Parameters
+    ----------
+    tracks : list
+
+    Returns
+    -------
+    data : bytes
+    """
+    skeleton: List[Any] = []
+    layouts: List[Optional[Dict[str, Any]]] = []
+    columns = bytearray()
+
+    for track in tracks:
+        notes = track.get("notes") if isinstance(track, dict) else None
+        keys = _note_keys(notes)
+        if keys is None:
+            skeleton.append(track)
+            layouts.append(None)
+            continue
+
+        skeleton.append({k: v for k, v in track.items() if k != "notes"})
+        types = [
+            _encode_column([note[key] for note in notes], columns)
+            for key in keys
+        ]
+        layouts.append(
+            {
+                "keys": keys,
+                "types": types,
+                "count": len(notes),
+                # Position of "notes" among the track's keys, so that keys
+                # are decoded in their original order.
+                "position": list(track).index("notes"),
+            }
+        )
+
+    header = codec.dumps({"tracks": skeleton, "layouts": layouts})
+    return (
+        bytes([HEADER_COLUMNAR])
+        + _LENGTH.pack(len(header))
+        + header
+        + bytes(columns)
+    )
+
+
+def decode_columnar(data: bytes) -> List[Any]:
+    """Decode tracks stored using the columnar format.
+
+    Parameters
+    ----------
+    data : bytes
+        Data returned by ``encode_columnar()``.
+
+    Returns
+    -------
+    tracks : list
+    """
+    length, = _LENGTH.unpack_from(data, 1)
+    offset = 1 + _LENGTH.size
+    skeleton = codec.loads(data[offset : offset + length])
+    offset += length
+
+    tracks = []
+    for track, layout in zip(skeleton["tracks"], skeleton["layouts"]):
+        if layout is None:
+            tracks.append(track)
+            continue
+
+        count = layout["count"]
+        columns = []
+        for code in layout["types"]:
+            values, offset = _decode_column(code, count, data, offset)
+            columns.append(values)
+
+        keys = layout["keys"]
+        notes = [dict(zip(keys, values)) for values in zip(*columns)]
+
+        items = list(track.items())
+        items.insert(layout["position"], ("notes", notes))
+        tracks.append(dict(items))
+
+    return tracks
+
+
+def encode_tracks(
+    tracks: List[Any], format: str = FORMAT_JSON, compression_level: int = 0
+) -> bytes:
+    """Encode tracks for storage.
+
+    Only lists of tracks can be stored as columns: any other JSON value is
+    stored as JSON, whatever the format, so that it is read back as-is.
+
+    Parameters
+    ----------
+    tracks : list
+    format : str, optional
+        One of ``FORMATS``. Defaults to ``"json"``.
+    compression_level : int, optional
+        The zlib compression level, from ``1`` (fastest) to ``9`` (smallest).
+        Defaults to ``0``, i.e. no compression.
+
+    Returns
+    -------
+    value : bytes
+        The value to store in the database.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown tracks format: {format!r}")
+    if format == FORMAT_COLUMNAR and isinstance(tracks, list):
+        value = encode_columnar(tracks)
+    else:
+        value = bytes([HEADER_JSON]) + codec.dumps(tracks)
+
+    if compression_level:
+        value = bytes([HEADER_ZLIB]) + zlib.compress(value, compression_level)
+
+    return value
+
+
+def decode_tracks(value: Union[str, bytes]) -> List[Any]:
+    """Decode tracks read from the database, whatever their format.
+
+    Parameters
+    ----------
+    value : str or bytes
+
+    Returns
+    -------
+    tracks : list
+    """
+    if isinstance(value, str):
+        return codec.loads(value)
+    header = value[0]
+    if header == HEADER_ZLIB:
+        return decode_tracks(zlib.decompress(value[1:]))
+    if header == HEADER_COLUMNAR:
+        return decode_columnar(value)
+    if header == HEADER_JSON:
+        return codec.loads(value[1:])
+    raise ValueError(f"Unknown tracks header: {header:#x}")
+
+
+def tracks_json(value: Union[str, bytes]) -> bytes:
+    """Return the JSON of stored tracks, as encoded by ``api.codec``.
+
+    Tracks stored in the ``json`` format are returned as-is (only
+    decompressed if needed), without being decoded.
+
+    Parameters
+    ----------
+    value : str or bytes
+
+    Returns
+    -------
+    json : bytes
+    """
+    if isinstance(value, bytes):
+        if value[0] == HEADER_ZLIB:
+            return tracks_json(zlib.decompress(value[1:]))
+        if value[0] == HEADER_JSON:
+            return value[1:]
+    return codec.dumps(decode_tracks(value))
@@ -0,0 +1,46 @@
+from api.cache import LRUCache, TTLCache
+
+
+def test_get_checks_version():
+    cache = LRUCache(100)
+    cache.put("a", 1, "value", 10)
+    assert cache.get("a", 1) == "value"
+    assert cache.get("a", 2) is None
+    assert cache.get("b", 1) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_least_recently_used_values_are_evicted():
+    cache = LRUCache(25)
+    cache.put("a", 1, "a", 10)
+    cache.put("b", 1, "b", 10)
+    cache.get("a", 1)
+    cache.put("c", 1, "c", 10)
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == "a"
+    assert cache.size == 20
+
+
+def test_values_larger_than_the_cache_are_not_cached():
+    cache = LRUCache(5)
+    cache.put("a", 1, "a", 10)
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+def test_pop():
+    cache = LRUCache(100)
+    cache.put("a", 1, "a", 10)
+    cache.pop("a")
+    cache.pop("b")
+    assert cache.get("a", 1) is None
+    assert cache.size == 0
+
+
+def test_ttl_cache_values_expire():
+    cache = TTLCache(60)
+    cache.put("a", "a")
+    cache.put("b", "b", ttl=0)
+    assert cache.get("a") == "a"
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (1, 1)
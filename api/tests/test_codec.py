@@ -0,0 +1,28 @@
+import pytest
+
+from api import codec
+
+DATA = {"name": "Chanson", "notes": [{"time": 0.5, "midi": 10}], "x": None}
+
+
+@pytest.mark.parametrize("backend", sorted(codec.BACKENDS))
+def test_backends_are_compatible(backend: str):
+    dumps, loads = codec.BACKENDS[backend]
+    encoded = dumps(DATA)
+    assert encoded == codec.BACKENDS["json"][0](DATA)
+    assert loads(encoded) == DATA
+    assert loads(encoded.decode()) == DATA
+
+
+@pytest.mark.parametrize("backend", sorted(codec.BACKENDS))
+def test_unsupported_values_fall_back_to_stdlib(backend: str):
+    dumps, loads = codec.BACKENDS[backend]
+    assert dumps(2 ** 70) == b"1180591620717411303424"
+    assert loads("NaN") != loads("NaN")
+
+
+@pytest.mark.parametrize("backend", sorted(codec.BACKENDS))
+def test_invalid_json(backend: str):
+    _, loads = codec.BACKENDS[backend]
+    with pytest.raises(ValueError):
+        loads("{")
@@ -0,0 +1,303 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from api.db import MIGRATIONS, Database
+
+
+@pytest.fixture
+def legacy_db(tmp_path) -> Database:
+    """A database created before schema migrations were introduced."""
+    legacy = Database(str(tmp_path / "legacy.db"))
+    with legacy:
+        legacy.cursor.execute(
+            """CREATE TABLE songs (
+                SongID integer primary key not null,
+                SongName text,
+                Created datetime,
+                Updated datetime,
+                TracksJson text
+            )"""
+        )
+        legacy.cursor.execute(
+            """CREATE TABLE song_user_links (
+                LinkID integer primary key not null,
+                SongID integer references songs,
+                UserName text references users
+            )"""
+        )
+        legacy.cursor.execute(
+            """CREATE TABLE tokens (
+                Token text primary key not null,
+                UserName text references users,
+                RefreshDate datetime
+            )"""
+        )
+    try:
+        yield legacy
+    finally:
+        legacy.remove()
+
+
+def test_connections_are_reused(db: Database):
+    with db:
+        first = db.connection
+    with db:
+        assert db.connection is first
+
+
+def test_nested_contexts_use_distinct_connections(db: Database):
+    with db:
+        outer = db.connection
+        with db:
+            assert db.connection is not outer
+        assert db.connection is outer
+
+
+def test_pooling_can_be_disabled(db: Database):
+    unpooled = Database(db.path, pool_size=0)
+    with unpooled:
+        first = unpooled.connection
+    with unpooled:
+        assert unpooled.connection is not first
+
+
+def test_transaction_uses_a_single_connection(db: Database):
+    with db.transaction():
+        with db:
+            outer = db.connection
+            with db:
+                assert db.connection is outer
+            with db.transaction():
+                with db:
+                    assert db.connection is outer
+
+
+def test_transaction_commits_once(db: Database):
+    with db.transaction():
+        song_id = db.create_song(name="Song", tracks=[])
+        db.create_song_user_link(song_id, "admin")
+        # Nothing is visible to other connections before the end.
+        assert Database(db.path).get_songs_by_user("admin") == []
+    assert db.get_songs_by_user("admin")[0]["id"] == song_id
+
+
+def test_transaction_rolls_back_on_error(db: Database):
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.create_song(name="Song", tracks=[])
+            raise RuntimeError
+    with db:
+        count, = db.cursor.execute("SELECT COUNT(*) FROM songs").fetchone()
+    assert count == 0
+
+
+def test_create_songs_with_same_name(db: Database):
+    with db.transaction():
+        first = db.create_song(name="Song", tracks=[])
+        second = db.create_song(name="Song", tracks=[])
+    assert first != second
+
+
+def test_default_pragmas_are_applied(db: Database):
+    with db:
+        journal_mode, = db.cursor.execute("PRAGMA journal_mode").fetchone()
+        synchronous, = db.cursor.execute("PRAGMA synchronous").fetchone()
+    assert journal_mode == "wal"
+    assert synchronous == 1  # NORMAL
+
+
+def test_custom_pragmas(db: Database):
+    custom = Database(db.path, pragmas={"synchronous": "full"})
+    with custom:
+        synchronous, = custom.cursor.execute("PRAGMA synchronous").fetchone()
+    assert synchronous == 2  # FULL
+    custom.close()
+
+
+def test_schema_is_up_to_date(db: Database):
+    assert db.schema_version == len(MIGRATIONS)
+    assert db.migrate() == len(MIGRATIONS)
+
+
+def test_migrate_existing_database(legacy_db: Database):
+    assert legacy_db.schema_version == 0
+    assert legacy_db.migrate() == len(MIGRATIONS)
+
+    with legacy_db:
+        plan = legacy_db.cursor.execute(
+            """
+            EXPLAIN QUERY PLAN
+            SELECT SongID FROM song_user_links WHERE UserName = ?
+            """,
+            ("admin",),
+        ).fetchall()
+    assert "song_user_links_user" in str(plan)
+
+
+def test_migrate_song_counts(legacy_db: Database):
+    tracks = [{"notes": [{"midi": 10}, {"midi": 12}]}, {"notes": []}]
+    with legacy_db:
+        legacy_db.cursor.execute(
+            "INSERT INTO songs (SongName, TracksJson) VALUES (?, ?)",
+            ("Song", json.dumps(tracks)),
+        )
+        legacy_db.connection.commit()
+
+    legacy_db.migrate()
+
+    with legacy_db:
+        counts = legacy_db.cursor.execute(
+            "SELECT TrackCount, NoteCount FROM songs"
+        ).fetchall()
+    assert counts == [(2, 2)]
+
+
+def test_migrate_song_counts_of_invalid_tracks(legacy_db: Database):
+    with legacy_db:
+        legacy_db.cursor.executemany(
+            "INSERT INTO songs (SongName, TracksJson) VALUES (?, ?)",
+            [("Null", "null"), ("Number", "5"), ("Notes", '[{"notes": 3}]')],
+        )
+        legacy_db.connection.commit()
+
+    legacy_db.migrate()
+
+    with legacy_db:
+        counts = legacy_db.cursor.execute(
+            "SELECT TrackCount, NoteCount FROM songs ORDER BY SongID"
+        ).fetchall()
+    assert counts == [(0, 0), (0, 0), (1, 0)]
+
+
+def test_write_behind_coalesces_updates(db: Database):
+    song_id = db.create_song(name="Song", tracks=[])
+    db.create_song_user_link(song_id, "admin")
+    writer = Database(db.path, write_behind=60)
+    try:
+        for index in range(3):
+            song = writer.update_song(
+                song_id, f"Song {index}", [{"notes": []}], "admin"
+            )
+        # Reads of the song see the update before it is written.
+        assert writer.get_song_by_id(song_id) == song
+        assert db.get_song_by_id(song_id)["name"] == "Song"
+
+        assert writer.flush() == 1
+        assert db.get_song_by_id(song_id) == song
+        assert db.get_song_summaries_by_user("admin")[0]["track_count"] == 1
+    finally:
+        writer.close()
+
+
+def test_write_behind_rejects_invalid_updates(db: Database):
+    song_ids = db.create_songs([{"name": "Song", "tracks": []}] * 2, "admin")
+    writer = Database(db.path, write_behind=60)
+    try:
+        # Invalid updates fail before being queued, not when written.
+        with pytest.raises(TypeError):
+            writer.update_song(song_ids[0], {"name": "Song"}, [], "admin")
+        assert writer.get_song_by_id(song_ids[0])["name"] == "Song"
+        writer.update_song(song_ids[1], "Renamed", 5, "admin")
+        assert writer.flush() == 1
+        assert writer.flush() == 0
+        assert db.get_song_by_id(song_ids[1])["tracks"] == 5
+    finally:
+        writer.close()
+
+
+def test_write_behind_flushes_on_close(db: Database):
+    song_id = db.create_song(name="Song", tracks=[])
+    db.create_song_user_link(song_id, "admin")
+    writer = Database(db.path, write_behind=60)
+    writer.update_song(song_id, "Renamed", [], "admin")
+    writer.close()
+    assert db.get_song_by_id(song_id)["name"] == "Renamed"
+
+
+def test_song_cache(db: Database):
+    song_id = db.create_song(name="Song", tracks=[{"notes": []}])
+    db.create_song_user_link(song_id, "admin")
+    cached = Database(db.path, cache_size=2 ** 20)
+    try:
+        song = cached.get_song_by_id(song_id)
+        assert cached.get_song_json(song_id) == db.get_song_json(song_id)
+        assert cached.get_song_by_id(song_id) == song
+        assert (cached.song_cache.hits, cached.song_cache.misses) == (2, 1)
+
+        # Updates made by other processes are detected.
+        db.update_song(song_id, "Renamed", [], "admin")
+        assert cached.get_song_by_id(song_id)["name"] == "Renamed"
+
+        cached.update_song(song_id, "Renamed again", [], "admin")
+        assert cached.get_song_by_id(song_id)["name"] == "Renamed again"
+
+        data, updated = cached.get_song_json_and_updated(song_id)
+        assert json.loads(data)["updated"] == updated
+        assert cached.get_song_json_and_updated(song_id) == (data, updated)
+    finally:
+        cached.close()
+
+
+def test_songs_version_by_user(db: Database):
+    db.create_user("smith", "Adam", "Smith", "password")
+    assert db.get_songs_version_by_user("smith") == (0, "")
+
+    versions = []
+    song_id, = db.create_songs([{"name": "Song", "tracks": []}], "smith")
+    versions.append(db.get_songs_version_by_user("smith"))
+    song = db.update_song(song_id, "Renamed", [], "smith")
+    versions.append(db.get_songs_version_by_user("smith"))
+    assert versions[-1][1] == song["updated"]
+    db.patch_song(
+        song_id, [{"op": "replace", "path": "/name", "value": "P"}], "smith"
+    )
+    versions.append(db.get_songs_version_by_user("smith"))
+    db.tracks_format = "columnar"
+    db.repack_songs()
+    assert db.get_songs_version_by_user("smith") == versions[-1]
+    db.delete_song(song_id, "smith")
+    versions.append(db.get_songs_version_by_user("smith"))
+
+    numbers = [version for version, _ in versions]
+    assert numbers == sorted(set(numbers))
+
+
+def test_deferred_transaction_does_not_block_writers(db: Database):
+    other = Database(db.path, pragmas={"busy_timeout": 0})
+    try:
+        with db.transaction(immediate=False):
+            assert not db.check_user("admin", "password")
+            other.create_user("smith", "Adam", "Smith", "password")
+    finally:
+        other.close()
+
+
+def test_import_does_not_create_database(tmp_path):
+    root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    env = {**os.environ, "PYTHONPATH": root}
+    env.pop("DATABASE", None)
+    subprocess.run(
+        [sys.executable, "-c", "import api"], cwd=tmp_path, env=env, check=True
+    )
+    assert os.listdir(tmp_path) == []
+
+    env["DATABASE"] = str(tmp_path / "migrated.db")
+    subprocess.run(
+        [sys.executable, "-m", "api", "migrate"],
+        cwd=tmp_path,
+        env=env,
+        check=True,
+    )
+    migrated = Database(env["DATABASE"])
+    try:
+        with migrated:
+            version, = migrated.cursor.execute(
+                "PRAGMA user_version"
+            ).fetchone()
+        assert version == len(MIGRATIONS)
+    finally:
+        migrated.close()
@@ -0,0 +1,65 @@
+import pytest
+
+from api.jsonpatch import (
+    InvalidPatch,
+    PatchConflict,
+    PatchError,
+    apply_patch,
+)
+
+
+@pytest.fixture
+def document() -> dict:
+    return {"foo": ["bar", "baz"], "a/b": {"c~d": 1}}
+
+
+@pytest.mark.parametrize(
+    "patch, expected",
+    [
+        (
+            [{"op": "add", "path": "/foo/1", "value": "qux"}],
+            {"foo": ["bar", "qux", "baz"], "a/b": {"c~d": 1}},
+        ),
+        (
+            [{"op": "remove", "path": "/foo/0"}],
+            {"foo": ["baz"], "a/b": {"c~d": 1}},
+        ),
+        (
+            [{"op": "replace", "path": "/a~1b/c~0d", "value": 2}],
+            {"foo": ["bar", "baz"], "a/b": {"c~d": 2}},
+        ),
+        (
+            [{"op": "move", "from": "/foo/0", "path": "/foo/-"}],
+            {"foo": ["baz", "bar"], "a/b": {"c~d": 1}},
+        ),
+        (
+            [{"op": "copy", "from": "/foo", "path": "/bar"}],
+            {"foo": ["bar", "baz"], "a/b": {"c~d": 1}, "bar": ["bar", "baz"]},
+        ),
+        (
+            [{"op": "test", "path": "/foo/1", "value": "baz"}],
+            {"foo": ["bar", "baz"], "a/b": {"c~d": 1}},
+        ),
+        ([{"op": "replace", "path": "", "value": 1}], 1),
+    ],
+)
+def test_apply_patch(document: dict, patch: list, expected):
+    assert apply_patch(document, patch) == expected
+
+
+@pytest.mark.parametrize(
+    "patch, exc",
+    [
+        ({}, InvalidPatch),
+        ([{"op": "add", "path": "foo", "value": 1}], InvalidPatch),
+        ([{"op": "add", "path": "/foo"}], InvalidPatch),
+        ([{"op": "test", "path": "/foo/0", "value": "baz"}], PatchConflict),
+        ([{"op": "remove", "path": "/foo/2"}], PatchError),
+        ([{"op": "remove", "path": "/foo/01"}], PatchError),
+        ([{"op": "replace", "path": "/missing", "value": 1}], PatchError),
+        ([{"op": "move", "from": "/foo", "path": "/foo/0"}], PatchError),
+    ],
+)
+def test_invalid_patch(document: dict, patch, exc):
+    with pytest.raises(exc):
+        apply_patch(document, patch)
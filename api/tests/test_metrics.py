@@ -0,0 +1,100 @@
+import logging
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from falcon import testing
+
+from api.db import Database
+from api.factory import create_api
+from api.metrics import Metrics, record
+
+
+@pytest.fixture
+def metrics(db: Database) -> Metrics:
+    db.on_timing = record
+    return Metrics()
+
+
+def test_metrics_endpoint(db: Database, metrics: Metrics, auth_headers: dict):
+    client = testing.TestClient(create_api(db, metrics=metrics))
+    client.simulate_get("/users/admin/songs", headers=auth_headers)
+    client.simulate_get("/users/admin/songs", headers=auth_headers)
+    client.simulate_get("/users/admin/songs")
+
+    result = client.simulate_get("/metrics")
+    assert result.status_code == 200
+    text = result.text
+    route = 'method="GET",route="/users/{username}/songs"'
+    assert f'polyphona_requests_total{{{route},status="200"}} 2' in text
+    assert f'polyphona_requests_total{{{route},status="401"}} 1' in text
+    assert f"polyphona_request_duration_seconds_count{{{route}}} 3" in text
+    assert f'polyphona_response_size_bytes_bucket{{{route},le="64"}} 3' in text
+    for phase in ("auth", "db"):
+        assert f'{{{route},phase="{phase}"}}' in text
+
+
+def test_metrics_are_summed_over_processes(tmp_path):
+    labels = (("route", "/songs/{pk}"),)
+    worker = Metrics(directory=str(tmp_path))
+    worker.inc("polyphona_requests_total", labels, 2)
+    worker.save(force=True)
+    # Pretend the metrics were saved by another process.
+    os.rename(worker._path(), tmp_path / "metrics-1.json")
+
+    current = Metrics(directory=str(tmp_path))
+    current.inc("polyphona_requests_total", labels, 3)
+    assert (
+        'polyphona_requests_total{route="/songs/{pk}"} 5' in current.render()
+    )
+
+
+def test_metrics_files_are_not_shared(tmp_path):
+    # E.g. a worker reusing the PID of a worker that exited.
+    first = Metrics(directory=str(tmp_path))
+    second = Metrics(directory=str(tmp_path))
+    assert first._path() != second._path()
+    assert first._path() == first._path()
+
+
+def test_metrics_directory_is_created(tmp_path, caplog):
+    directory = tmp_path / "metrics"
+    metrics = Metrics(directory=str(directory))
+    assert directory.is_dir()
+
+    directory.rmdir()
+    with caplog.at_level(logging.ERROR, logger="api.metrics"):
+        metrics.save(force=True)
+    assert "Failed to save metrics" in caplog.text
+
+
+def _count(metrics: Metrics) -> str:
+    return metrics.render().split('polyphona_requests_total{route="/"} ')[1]
+
+
+def test_idle_workers_save_their_last_requests(tmp_path):
+    labels = (("route", "/"),)
+    worker = Metrics(directory=str(tmp_path), interval=0.1)
+    for _ in range(2):
+        worker.inc("polyphona_requests_total", labels)
+        worker.save()
+    time.sleep(0.3)
+
+    other = Metrics(directory=str(tmp_path))
+    other.inc("polyphona_requests_total", labels)
+    assert _count(other).startswith("3\n")
+
+
+def test_metrics_are_saved_at_exit(tmp_path):
+    code = (
+        "from api.metrics import Metrics; "
+        f"metrics = Metrics(directory={str(tmp_path)!r}, interval=60); "
+        "metrics.inc('polyphona_requests_total', (('route', '/'),))"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+    other = Metrics(directory=str(tmp_path))
+    other.inc("polyphona_requests_total", (("route", "/"),))
+    assert _count(other).startswith("2\n")
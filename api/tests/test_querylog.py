@@ -0,0 +1,91 @@
+import logging
+
+import pytest
+
+from api.db import Database
+from api.querylog import QueryLog, is_full_scan, normalize
+
+
+@pytest.fixture
+def timed_db(tmp_path) -> Database:
+    db = Database(
+        str(tmp_path / "timed.db"), query_log=QueryLog(threshold=0.1)
+    )
+    db.generate_schema()
+    db.create_user("smith", "Adam", "Smith", "password")
+    try:
+        yield db
+    finally:
+        db.remove()
+
+
+def _stats(db: Database, template: str) -> dict:
+    summary = {item["template"]: item for item in db.query_log.summary()}
+    return summary[template]
+
+
+def test_normalize():
+    sql = """
+        SELECT * FROM songs
+        WHERE SongID IN (?,?, ?)
+    """
+    assert normalize(sql) == "SELECT * FROM songs WHERE SongID IN (?, ...)"
+
+
+def test_is_full_scan():
+    assert is_full_scan(["SCAN songs"])
+    assert not is_full_scan(["SEARCH songs USING INTEGER PRIMARY KEY"])
+    assert not is_full_scan(["SCAN tokens USING COVERING INDEX tokens_x"])
+
+
+def test_statements_are_timed(timed_db: Database):
+    for _ in range(3):
+        song_id = timed_db.create_song(name="Song", tracks=[])
+        timed_db.create_song_user_link(song_id, "smith")
+    assert len(timed_db.get_songs_by_ids([1, 2, 3])) == 3
+
+    stats = _stats(
+        timed_db,
+        "SELECT SongID, SongName, Created, Updated, TracksJson "
+        "FROM songs WHERE SongID IN (?, ...)",
+    )
+    assert stats["count"] == 1
+    assert stats["rows"] == 3
+    assert stats["total_time"] == pytest.approx(
+        stats["execute_time"] + stats["fetch_time"]
+    )
+    assert stats["plan"] is None
+
+
+def test_listing_statements_are_timed(timed_db: Database):
+    timed_db.create_songs([{"name": "Song", "tracks": []}] * 2, "smith")
+    timed_db.query_log.reset()
+    assert len(timed_db.get_songs_by_user("smith")) == 2
+    assert len(timed_db.get_song_summaries_by_user("smith")) == 2
+
+    summary = timed_db.query_log.summary()
+    listings = [
+        item for item in summary if "song_user_links" in item["template"]
+    ]
+    assert len(listings) == 2
+    assert all(item["rows"] == 2 for item in listings)
+
+
+def test_slow_statements_are_explained(timed_db: Database, caplog):
+    timed_db.query_log.threshold = 0
+    sql = "SELECT SongID FROM songs WHERE SongName = ?"
+    with caplog.at_level(logging.WARNING, logger="api.querylog"):
+        with timed_db:
+            timed_db.cursor.execute(sql, ("Song",)).fetchall()
+            timed_db.cursor.execute(sql, ("Other",)).fetchall()
+
+    stats = _stats(timed_db, sql)
+    assert stats["slow"] == 2
+    assert stats["plan"] == ["SCAN songs"]
+    assert stats["full_scan"]
+    assert "Full table scan!" in caplog.text
+
+
+def test_reset(timed_db: Database):
+    timed_db.query_log.reset()
+    assert timed_db.query_log.summary() == []
@@ -0,0 +1,157 @@
+import collections
+
+import pytest
+from falcon import testing
+
+from api.db import Database
+from api.factory import create_api
+from api.sharding import (
+    ShardedDatabase,
+    assign_buckets,
+    rebalance,
+    song_bucket,
+    token_bucket,
+    user_bucket,
+)
+
+SONG = {"name": "Song", "tracks": [{"notes": [{"time": 0}]}]}
+
+
+def _paths(tmp_path, count: int) -> list:
+    return [str(tmp_path / f"shard{index}.db") for index in range(count)]
+
+
+@pytest.fixture
+def sharded(tmp_path) -> ShardedDatabase:
+    db = ShardedDatabase(_paths(tmp_path, 3))
+    db.generate_schema()
+    try:
+        yield db
+    finally:
+        db.remove()
+
+
+def _add_users(db, count: int) -> dict:
+    # Users and the IDs of their songs.
+    library = {}
+    for index in range(count):
+        username = f"user{index}"
+        db.create_user(username, username, username, username)
+        library[username] = db.create_songs([SONG] * 2, username)
+    return library
+
+
+def test_adding_a_shard_only_moves_buckets_to_it():
+    before, after = assign_buckets(4), assign_buckets(5)
+    moved = [new for old, new in zip(before, after) if old != new]
+    assert set(moved) == {4}
+    assert 100 < len(moved) < 300
+    assert min(collections.Counter(after).values()) > 100
+
+
+def test_token_bucket():
+    assert token_bucket("3ff-a7c5e1f2-0000-4000-8000-000000000000") == 1023
+    assert token_bucket("a7c5e1f2-0000-4000-8000-000000000000") is None
+    assert token_bucket("1234") is None
+
+
+def test_users_and_songs_are_routed(sharded: ShardedDatabase):
+    library = _add_users(sharded, 20)
+    used = set()
+    for username, song_ids in library.items():
+        shard = sharded.shard_for_user(username)
+        used.add(shard.path)
+        assert not shard.user_exists(username)
+        assert all(song_bucket(id) == user_bucket(username) for id in song_ids)
+        summaries = sharded.get_song_summaries_by_user(username)
+        assert [song["id"] for song in summaries] == song_ids
+        assert sharded.get_song_by_id(song_ids[0])["name"] == "Song"
+    assert len(used) > 1
+
+    ids = [id for song_ids in library.values() for id in song_ids]
+    assert len(set(ids)) == len(ids)
+    songs = sharded.get_songs_by_ids(ids[::-1])
+    assert [song["id"] for song in songs] == ids[::-1]
+
+
+def test_opaque_tokens_are_routed(sharded: ShardedDatabase):
+    _add_users(sharded, 1)
+    token = sharded.create_token("user0")
+    assert token_bucket(token) == user_bucket("user0")
+    assert sharded.reverse_token(token) == "user0"
+    # Tokens without a bucket are looked up on every shard.
+    sharded.save_token("user0", "1234")
+    assert sharded.reverse_token("1234") == "user0"
+    sharded.delete_token(token)
+    assert sharded.reverse_token(token) is None
+
+
+def test_transaction_rolls_back_on_error(sharded: ShardedDatabase):
+    _add_users(sharded, 1)
+    with pytest.raises(RuntimeError):
+        with sharded.transaction():
+            sharded.create_songs([SONG], "user0")
+            raise RuntimeError
+    assert len(sharded.get_songs_by_user("user0")) == 2
+
+
+def test_api(sharded: ShardedDatabase):
+    _add_users(sharded, 1)
+    client = testing.TestClient(create_api(sharded))
+    credentials = {"username": "user0", "password": "user0"}
+    token = client.simulate_post("/tokens", json=credentials).json["token"]
+    headers = {"Authorization": f"Token {token}"}
+
+    result = client.simulate_post("/songs", headers=headers, json=SONG)
+    assert result.status_code == 201
+    song_id = result.json["id"]
+    result = client.simulate_get(f"/songs/{song_id}", headers=headers)
+    assert result.json["tracks"] == SONG["tracks"]
+    result = client.simulate_get("/users/user0/songs", headers=headers)
+    assert len(result.json) == 3
+
+
+def test_rebalance(tmp_path):
+    legacy = Database(str(tmp_path / "legacy.db"))
+    legacy.generate_schema()
+    for index in range(10):
+        username = f"user{index}"
+        legacy.create_user(username, username, username, username)
+        legacy.create_songs([SONG] * 2, username)
+        legacy.save_token(username, f"token{index}")
+    legacy.close()
+
+    # Split a database created without sharding: songs get new IDs.
+    paths = _paths(tmp_path, 2)
+    counts = rebalance([legacy.path], paths)
+    assert counts == {"users": 10, "songs": 20, "renumbered": 20}
+    db = ShardedDatabase(paths)
+    library = {
+        username: [song["id"] for song in db.get_songs_by_user(username)]
+        for username in (f"user{index}" for index in range(10))
+    }
+    assert all(len(song_ids) == 2 for song_ids in library.values())
+    assert db.reverse_token("token3") == "user3"
+    versions = {
+        username: db.get_songs_version_by_user(username)[0]
+        for username in library
+    }
+    db.close()
+
+    # Add a shard: song IDs do not change, and versions never go back.
+    new_paths = _paths(tmp_path, 3)
+    counts = rebalance(paths, new_paths)
+    assert 0 < counts["users"] < 10
+    assert counts["renumbered"] == 0
+    db = ShardedDatabase(new_paths)
+    for username, song_ids in library.items():
+        assert not db.user_exists(username)
+        assert [song["id"] for song in db.get_songs_by_user(username)] == (
+            song_ids
+        )
+        version, _ = db.get_songs_version_by_user(username)
+        assert version >= versions[username]
+    assert db.reverse_token("token3") == "user3"
+    db.close()
+
+    assert rebalance(new_paths, new_paths)["users"] == 0
@@ -0,0 +1,24 @@
+import datetime
+
+from api.signing import TokenSigner, is_signed
+
+
+def test_sign_and_verify():
+    signer = TokenSigner(b"secret")
+    token = signer.sign("admin")
+    assert is_signed(token)
+    claims = signer.verify(token)
+    assert claims.username == "admin"
+    assert signer.sign("admin") != token
+
+
+def test_invalid_signature():
+    token = TokenSigner(b"secret").sign("admin")
+    assert TokenSigner(b"other").verify(token) is None
+    payload = token.partition(".")[0]
+    assert TokenSigner(b"secret").verify(payload + ".é") is None
+
+
+def test_expired_token():
+    signer = TokenSigner(b"secret", lifetime=datetime.timedelta(seconds=-1))
+    assert signer.verify(signer.sign("admin")) is None
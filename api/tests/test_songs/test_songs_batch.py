@@ -0,0 +1,48 @@
+from api.db import Database
+
+
+def test_create_songs(
+    client, auth_headers: dict, db: Database, song1: dict, song2: dict
+):
+    result = client.simulate_post(
+        "/songs/batch", headers=auth_headers, json={"songs": [song1, song2]}
+    )
+    assert result.status_code == 201
+    songs = result.json
+    assert [song["name"] for song in songs] == ["Song 01", "Song 02"]
+    assert songs[1]["tracks"] == song2["tracks"]
+    listed = db.get_songs_by_user("admin")
+    assert [song["id"] for song in listed] == [song["id"] for song in songs]
+
+
+def test_create_songs_missing_field(
+    client, auth_headers: dict, db: Database, song1: dict
+):
+    result = client.simulate_post(
+        "/songs/batch",
+        headers=auth_headers,
+        json={"songs": [song1, {"name": "No tracks"}]},
+    )
+    assert result.status_code == 400
+    assert db.get_songs_by_user("admin") == []
+
+
+def test_get_songs_by_ids(
+    client, auth_headers: dict, db: Database, song1: dict, song2: dict
+):
+    first, second = db.create_songs([song1, song2], username="admin")
+    result = client.simulate_get(
+        "/songs/",
+        headers=auth_headers,
+        params={"ids": f"{second},{first},{second + 100}"},
+    )
+    assert result.status_code == 200
+    assert [song["id"] for song in result.json] == [second, first]
+    assert result.json[1]["tracks"] == song1["tracks"]
+
+
+def test_get_songs_by_ids_invalid(client, auth_headers: dict):
+    result = client.simulate_get(
+        "/songs/", headers=auth_headers, params={"ids": "1,two"}
+    )
+    assert result.status_code == 400
@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from api.db import Database
+
+THREADS = 16
+ITERATIONS = 10
+
+
+def test_concurrent_requests(
+    client, db: Database, auth_headers: dict, song1: dict
+):
+    def worker(n: int) -> list:
+        statuses = []
+        for i in range(ITERATIONS):
+            song = {**song1, "name": f"Song {n}-{i}"}
+            result = client.simulate_post(
+                "/songs", headers=auth_headers, json=song
+            )
+            statuses.append(result.status_code)
+            pk = result.json["id"]
+            assert result.json["name"] == song["name"]
+
+            result = client.simulate_get(f"/songs/{pk}", headers=auth_headers)
+            statuses.append(result.status_code)
+            assert result.json["name"] == song["name"]
+
+            song["name"] += " (edited)"
+            result = client.simulate_put(
+                f"/songs/{pk}", headers=auth_headers, json=song
+            )
+            statuses.append(result.status_code)
+            assert result.json["name"] == song["name"]
+        return statuses
+
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        results = list(executor.map(worker, range(THREADS)))
+
+    assert all(
+        status in (200, 201) for statuses in results for status in statuses
+    )
+
+    result = client.simulate_get("/users/admin/songs", headers=auth_headers)
+    assert result.status_code == 200
+    assert len(result.json) == THREADS * ITERATIONS
@@ -12,3 +12,10 @@ def test_create_song(client, auth_headers: dict, song1: dict, song2: dict):
     for song in (song1, song2):
         result = client.simulate_post("/songs", headers=auth_headers, json=song)
         assert result.status_code == 201
+
+
+def test_create_song_with_null_tracks(client, auth_headers: dict):
+    song = {"name": "Song", "tracks": None}
+    result = client.simulate_post("/songs", headers=auth_headers, json=song)
+    assert result.status_code == 201
+    assert result.json["tracks"] is None
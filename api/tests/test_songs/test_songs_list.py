@@ -1,5 +1,8 @@
+import json
+
 import pytest
 
+from api import codec
 from api.db import Database
 
 
@@ -51,3 +54,130 @@ def test_with_existing_songs(
         (1, song1["name"]),
         (2, song2["name"]),
     ]
+
+
+def test_paginate_songs(client, username, db: Database, auth_headers, song1):
+    song_ids = []
+    for _ in range(5):
+        song_id = db.create_song(**song1)
+        db.create_song_user_link(song_id=song_id, username=username)
+        song_ids.append(song_id)
+
+    url = f"/users/{username}/songs?limit=2"
+    pages = []
+    while url:
+        result = client.simulate_get(url, headers=auth_headers)
+        assert result.status_code == 200
+        pages.append([song["id"] for song in result.json])
+        link = result.headers.get("link")
+        url = link and link[1 : link.index(">")]
+
+    assert pages == [song_ids[:2], song_ids[2:4], song_ids[4:]]
+
+
+def test_paginate_songs_without_ids(
+    client, username, db: Database, auth_headers, song1
+):
+    for _ in range(3):
+        song_id = db.create_song(**song1)
+        db.create_song_user_link(song_id=song_id, username=username)
+
+    result = client.simulate_get(
+        f"/users/{username}/songs?limit=2&fields=name", headers=auth_headers
+    )
+    assert result.status_code == 200
+    assert result.json == [{"name": song1["name"]}] * 2
+    assert "after=2" in result.headers["link"]
+
+
+@pytest.mark.parametrize("query", ["limit=0", "limit=1000", "after=foo"])
+def test_if_invalid_pagination_then_bad_request(
+    client, username, auth_headers, query
+):
+    result = client.simulate_get(
+        f"/users/{username}/songs?{query}", headers=auth_headers
+    )
+    assert result.status_code == 400
+
+
+def test_list_song_summaries(
+    client, username, db: Database, auth_headers, song1
+):
+    song_id = db.create_song(**song1)
+    db.create_song_user_link(song_id=song_id, username=username)
+
+    result = client.simulate_get(
+        f"/users/{username}/songs?fields=id,name,track_count,note_count",
+        headers=auth_headers,
+    )
+    assert result.status_code == 200
+    assert result.json == [
+        {
+            "id": song_id,
+            "name": song1["name"],
+            "track_count": 1,
+            "note_count": 1,
+        }
+    ]
+
+
+def test_if_unknown_field_then_bad_request(client, username, auth_headers):
+    result = client.simulate_get(
+        f"/users/{username}/songs?fields=id,password", headers=auth_headers
+    )
+    assert result.status_code == 400
+
+
+def test_songs_are_streamed_as_json_array(
+    client, username, db: Database, auth_headers, song1, song2
+):
+    for song in song1, song2:
+        song_id = db.create_song(**song)
+        db.create_song_user_link(song_id=song_id, username=username)
+
+    result = client.simulate_get(
+        f"/users/{username}/songs", headers=auth_headers
+    )
+    assert result.status_code == 200
+    assert result.headers["content-type"] == "application/json"
+    expected = db.get_songs_by_user(username)
+    assert result.content == codec.dumps(expected)
+
+
+def test_songs_are_streamed_as_ndjson(
+    client, username, db: Database, auth_headers, song1, song2
+):
+    for song in song1, song2:
+        song_id = db.create_song(**song)
+        db.create_song_user_link(song_id=song_id, username=username)
+
+    result = client.simulate_get(
+        f"/users/{username}/songs",
+        headers={**auth_headers, "Accept": "application/x-ndjson"},
+    )
+    assert result.status_code == 200
+    assert result.headers["content-type"] == "application/x-ndjson"
+    lines = result.text.splitlines()
+    assert [json.loads(line)["name"] for line in lines] == [
+        song1["name"],
+        song2["name"],
+    ]
+
+
+def test_if_etag_matches_then_not_modified(
+    client, username, db: Database, auth_headers, song1, song2
+):
+    url = f"/users/{username}/songs"
+    song_id = db.create_song(**song1)
+    db.create_song_user_link(song_id=song_id, username=username)
+    etag = client.simulate_get(url, headers=auth_headers).headers["etag"]
+
+    headers = {**auth_headers, "If-None-Match": etag}
+    result = client.simulate_get(url, headers=headers)
+    assert result.status_code == 304
+
+    song_id = db.create_song(**song2)
+    db.create_song_user_link(song_id=song_id, username=username)
+    result = client.simulate_get(url, headers=headers)
+    assert result.status_code == 200
+    assert len(result.json) == 2
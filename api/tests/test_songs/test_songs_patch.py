@@ -0,0 +1,79 @@
+import pytest
+
+from api.db import Database
+
+JSON_PATCH = "application/json-patch+json"
+
+
+@pytest.fixture
+def song_id(db: Database, song1: dict) -> int:
+    song_id = db.create_song(**song1)
+    db.create_song_user_link(song_id, "admin")
+    return song_id
+
+
+def patch(client, url: str, headers: dict, operations: list):
+    return client.simulate_patch(
+        url,
+        headers={**headers, "Content-Type": JSON_PATCH},
+        json=operations,
+    )
+
+
+def test_patch_song(client, auth_headers: dict, song_id: int, song1: dict):
+    result = patch(
+        client,
+        f"/songs/{song_id}",
+        auth_headers,
+        [
+            {"op": "replace", "path": "/name", "value": "Renamed"},
+            {"op": "replace", "path": "/tracks/0/notes/0/time", "value": 42},
+            {
+                "op": "add",
+                "path": "/tracks/0/notes/-",
+                "value": {"midi": 12, "time": 50},
+            },
+        ],
+    )
+    assert result.status_code == 200
+    song = result.json
+    assert song["name"] == "Renamed"
+    notes = song["tracks"][0]["notes"]
+    assert [note["time"] for note in notes] == [42, 50]
+    assert notes[0]["note"] == song1["tracks"][0]["notes"][0]["note"]
+
+
+def test_if_token_missing_then_unauthorized(client, song_id: int):
+    result = patch(client, f"/songs/{song_id}", {}, [])
+    assert result.status_code == 401
+
+
+def test_if_song_does_not_exist_then_404(
+    client, auth_headers: dict, song_id: int
+):
+    result = patch(client, f"/songs/{song_id + 10}", auth_headers, [])
+    assert result.status_code == 404
+
+
+@pytest.mark.parametrize(
+    "operations, status",
+    [
+        ({"op": "remove", "path": "/name"}, 400),
+        ([{"op": "frobnicate", "path": "/name"}], 400),
+        ([{"op": "test", "path": "/name", "value": "Other"}], 409),
+        ([{"op": "remove", "path": "/tracks/3"}], 422),
+        ([{"op": "remove", "path": "/name"}], 422),
+    ],
+)
+def test_if_invalid_patch_then_error(
+    client,
+    db: Database,
+    auth_headers: dict,
+    song_id: int,
+    song1: dict,
+    operations,
+    status: int,
+):
+    result = patch(client, f"/songs/{song_id}", auth_headers, operations)
+    assert result.status_code == status
+    assert db.get_song_by_id(song_id)["name"] == song1["name"]
@@ -1,4 +1,14 @@
+import json
+
+import pytest
+
+from falcon import testing
+
+from api import codec
 from api.db import Database
+from api.factory import create_api
+from api.querylog import QueryLog
+from api.storage import FORMATS
 
 
 def test_retrieve_song(client, db: Database, auth_headers: dict, song1: dict):
@@ -22,3 +32,94 @@ def test_if_song_does_not_exist_then_not_found(client, auth_headers):
     result = client.simulate_get("/songs/1", headers=auth_headers)
     assert result.status_code == 404
 
+
+
+def test_if_etag_matches_then_not_modified(
+    client, db: Database, auth_headers: dict, song1: dict
+):
+    song_id = db.create_song(**song1)
+    result = client.simulate_get(f"/songs/{song_id}", headers=auth_headers)
+    etag = result.headers["etag"]
+    assert result.headers["last-modified"]
+
+    result = client.simulate_get(
+        f"/songs/{song_id}", headers={**auth_headers, "If-None-Match": etag}
+    )
+    assert result.status_code == 304
+    assert result.content == b""
+
+
+def test_if_etag_matches_then_tracks_are_not_loaded(
+    db: Database, auth_headers: dict, song1: dict
+):
+    song_id = db.create_song(**song1)
+    timed = Database(db.path, query_log=QueryLog(threshold=60))
+    try:
+        client = testing.TestClient(create_api(timed))
+        result = client.simulate_get(f"/songs/{song_id}", headers=auth_headers)
+        etag = result.headers["etag"]
+
+        timed.query_log.reset()
+        result = client.simulate_get(
+            f"/songs/{song_id}",
+            headers={**auth_headers, "If-None-Match": etag},
+        )
+        assert result.status_code == 304
+        assert result.headers["last-modified"]
+        templates = [item["template"] for item in timed.query_log.summary()]
+        assert templates
+        assert not any("TracksJson" in template for template in templates)
+    finally:
+        timed.close()
+
+
+def test_if_song_updated_then_etag_changes(
+    client, db: Database, auth_headers: dict, song1: dict, song2: dict
+):
+    song_id = db.create_song(**song1)
+    db.create_song_user_link(song_id, "admin")
+    result = client.simulate_get(f"/songs/{song_id}", headers=auth_headers)
+    etag = result.headers["etag"]
+
+    result = client.simulate_put(
+        f"/songs/{song_id}", headers=auth_headers, json=song2
+    )
+    assert result.headers["etag"] != etag
+
+    result = client.simulate_get(
+        f"/songs/{song_id}", headers={**auth_headers, "If-None-Match": etag}
+    )
+    assert result.status_code == 200
+    assert result.json["name"] == song2["name"]
+
+
+@pytest.mark.parametrize("tracks_format", FORMATS)
+@pytest.mark.parametrize("compression_level", [0, 6])
+def test_song_json_is_passed_through(
+    client,
+    db: Database,
+    auth_headers: dict,
+    song1: dict,
+    tracks_format: str,
+    compression_level: int,
+):
+    db.tracks_format = tracks_format
+    db.compression_level = compression_level
+    song_id = db.create_song(**song1)
+    result = client.simulate_get(f"/songs/{song_id}", headers=auth_headers)
+    assert result.status_code == 200
+    assert result.headers["content-type"] == "application/json"
+    assert result.content == codec.dumps(db.get_song_by_id(song_id))
+
+
+def test_legacy_song_json(client, db: Database, auth_headers: dict, song1):
+    song_id = db.create_song(**song1)
+    with db:
+        # Songs saved by earlier versions are stored as text.
+        db.cursor.execute(
+            "UPDATE songs SET TracksJson = ?",
+            (json.dumps(song1["tracks"]),),
+        )
+        db.connection.commit()
+    result = client.simulate_get(f"/songs/{song_id}", headers=auth_headers)
+    assert result.content == codec.dumps(db.get_song_by_id(song_id))
@@ -37,3 +37,16 @@ def test_if_malformed_json_then_bad_request(
         f"/songs/{song_id}", headers=auth_headers, body="qsdmnve"
     )
     assert result.status_code == 400
+
+
+def test_if_name_is_not_a_string_then_bad_request(
+    client, db: Database, auth_headers: dict, song1: dict
+):
+    song_id = db.create_song(**song1)
+    db.create_song_user_link(song_id, "admin")
+    result = client.simulate_put(
+        f"/songs/{song_id}",
+        headers=auth_headers,
+        json={**song1, "name": {"x": 1}},
+    )
+    assert result.status_code == 400
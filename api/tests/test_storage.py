@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from api import codec
+from api.db import Database
+from api.storage import (
+    FORMAT_COLUMNAR,
+    FORMATS,
+    decode_tracks,
+    encode_columnar,
+    encode_tracks,
+    tracks_json,
+)
+
+TRACKS = [
+    {
+        "id": 1,
+        "name": "Cello",
+        "notes": [
+            {"midi": 10, "time": 0.5, "note": "A2", "velocity": 64},
+            {"midi": 300, "time": 1.5, "note": "C4", "velocity": -2},
+        ],
+        "instrument": "Cello",
+    },
+    # Notes that cannot be stored as columns.
+    {"id": 2, "notes": [{"midi": 10}, {"time": 1}]},
+    {"id": 3, "notes": []},
+    {"id": 4},
+    # Columns with mixed or unusual types.
+    {"notes": [{"a": True, "b": None, "c": 2 ** 40, "d": 1}] * 2},
+    {"notes": [{"a": 1, "b": 1.5}, {"a": 2.5, "b": "x"}]},
+]
+
+
+@pytest.mark.parametrize("compression_level", [0, 1, 9])
+@pytest.mark.parametrize("format", FORMATS)
+def test_encode_decode(format: str, compression_level: int):
+    value = encode_tracks(TRACKS, format, compression_level)
+    decoded = decode_tracks(value)
+    assert decoded == TRACKS
+    # Key order is preserved too.
+    assert json.dumps(decoded) == json.dumps(TRACKS)
+
+
+@pytest.mark.parametrize("tracks", [None, 5, "abc", {"a": 1}])
+@pytest.mark.parametrize("format", FORMATS)
+def test_encode_decode_non_list_tracks(format: str, tracks):
+    assert decode_tracks(encode_tracks(tracks, format)) == tracks
+
+
+def test_columnar_is_smaller():
+    tracks = [{"notes": [{"midi": i % 100, "note": "A2"} for i in range(100)]}]
+    assert len(encode_columnar(tracks)) < len(codec.dumps(tracks)) / 3
+
+
+def test_uncompressed_rows_are_readable(db: Database):
+    song_id = db.create_song(name="Song", tracks=TRACKS)
+    db.create_song_user_link(song_id, "admin")
+    db.compression_level = 6
+    assert db.get_song_by_id(song_id)["tracks"] == TRACKS
+
+    db.update_song(song_id, name="Song", tracks=TRACKS, username="admin")
+    assert db.get_song_by_id(song_id)["tracks"] == TRACKS
+
+
+def test_repack_songs(db: Database):
+    song_id = db.create_song(name="Song", tracks=TRACKS)
+    song = db.get_song_by_id(song_id)
+
+    db.tracks_format = FORMAT_COLUMNAR
+    db.compression_level = 6
+    assert db.repack_songs(batch_size=1) == 1
+    assert db.repack_songs() == 0
+
+    with db:
+        stored, = db.cursor.execute(
+            "SELECT TracksJson FROM songs"
+        ).fetchone()
+    assert isinstance(stored, bytes)
+    assert db.get_song_by_id(song_id) == song
+
+
+@pytest.mark.parametrize("compression_level", [0, 6])
+@pytest.mark.parametrize("format", FORMATS)
+def test_tracks_json(format: str, compression_level: int):
+    value = encode_tracks(TRACKS, format, compression_level)
+    assert tracks_json(value) == codec.dumps(TRACKS)
+    assert tracks_json(json.dumps(TRACKS)) == codec.dumps(TRACKS)
@@ -0,0 +1,20 @@
+from api import codec
+from api.resources.streaming import CHUNK_SIZE, json_array, json_lines
+
+
+def test_json_array_matches_codec():
+    items = [
+        {"id": i, "name": "é" * 100} for i in range(2 * CHUNK_SIZE // 100)
+    ]
+    chunks = list(json_array(iter(items)))
+    assert len(chunks) > 1
+    assert b"".join(chunks) == codec.dumps(items)
+
+
+def test_empty_json_array():
+    assert b"".join(json_array(iter([]))) == b"[]"
+
+
+def test_json_lines():
+    items = [{"id": 1}, {"id": 2}]
+    assert b"".join(json_lines(items)) == b'{"id":1}\n{"id":2}\n'
@@ -1,6 +1,7 @@
 import pytest
 
 from api.db import Database
+from api.signing import TokenSigner
 
 
 @pytest.fixture
@@ -43,3 +44,86 @@ def test_create_token(client, payload, db: Database):
 def test_delete_token(client, auth_headers: dict, token: str):
     result = client.simulate_delete(f"/tokens/{token}")
     assert result.status_code == 204
+
+
+def test_expired_token_is_rejected(
+    client, auth_headers: dict, token: str, db: Database
+):
+    with db:
+        db.cursor.execute(
+            "UPDATE tokens SET RefreshDate = ? WHERE Token = ?",
+            ("2000-01-01 00:00:00", token),
+        )
+        db.connection.commit()
+    result = client.simulate_get("/users/admin/songs", headers=auth_headers)
+    assert result.status_code == 401
+
+
+def test_token_cache(auth_headers: dict, token: str, db: Database):
+    cached = Database(db.path, token_cache_ttl=60)
+    try:
+        assert cached.reverse_token(token) == "admin"
+        assert cached.reverse_token(token) == "admin"
+        assert cached.token_cache.hits == 1
+        cached.delete_token(token)
+        assert cached.reverse_token(token) is None
+    finally:
+        cached.close()
+
+
+def test_signed_tokens(auth_headers: dict, token: str, db: Database):
+    signed = Database(db.path, token_signer=TokenSigner(b"secret"))
+    try:
+        # Opaque tokens remain valid.
+        assert signed.reverse_token(token) == "admin"
+
+        signed_token = signed.create_token("admin")
+        assert signed.reverse_token(signed_token) == "admin"
+        with db:
+            rows = db.cursor.execute("SELECT Token FROM tokens").fetchall()
+        assert rows == [(token,)]
+
+        signed.delete_token(signed_token)
+        assert signed.reverse_token(signed_token) is None
+        # Other processes see the revocation too.
+        other = Database(db.path, token_signer=TokenSigner(b"secret"))
+        assert other.reverse_token(signed_token) is None
+    finally:
+        signed.close()
+
+
+def test_revocations_are_reloaded_periodically(db: Database):
+    signer = TokenSigner(b"secret")
+    signed = Database(db.path, token_signer=signer, revocation_refresh=60)
+    other = Database(db.path, token_signer=signer)
+    try:
+        first, second = signer.sign("admin"), signer.sign("admin")
+        assert signed.reverse_token(first) == "admin"
+        other.delete_token(first)
+        # The list of revocations is not reloaded on every check.
+        assert signed.reverse_token(first) == "admin"
+        signed.delete_token(second)
+        assert signed.reverse_token(second) is None
+
+        signed.revocation_refresh = 0
+        assert signed.reverse_token(first) is None
+    finally:
+        signed.close()
+        other.close()
+
+
+def test_sweep_expired_tokens(db: Database):
+    db.save_token("admin", "valid")
+    with db:
+        db.cursor.executemany(
+            "INSERT INTO tokens (Token, UserName, RefreshDate) VALUES (?,?,?)",
+            [(f"expired{i}", "admin", "2000-01-01") for i in range(5)],
+        )
+        db.connection.commit()
+
+    count, elapsed = db.sweep_expired_tokens(batch_size=2)
+    assert count == 5
+    assert elapsed >= 0
+    with db:
+        rows = db.cursor.execute("SELECT Token FROM tokens").fetchall()
+    assert rows == [("valid",)]
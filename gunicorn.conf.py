@@ -0,0 +1,9 @@
+"""Gunicorn settings, loaded by default from the current directory."""
+
+
+def on_starting(server):
+    # Create or upgrade the database schema once, in the master process,
+    # before workers are forked.
+    from api.__main__ import main
+
+    main(["migrate"])